@@ -0,0 +1,240 @@
+"""
+This file benchmarks the simulation and optimization code on synthetic road networks.
+Grid and spider networks of increasing size are generated offline with SUMO's netgenerate, given random background
+traffic, and placed on the map so they can be used like the downloaded networks.
+The timings of each network are written to a JSON file in the benchmark directory so they can be compared between
+versions of the code.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import platform
+import subprocess
+
+import numpy as np
+import pyproj
+
+from file_paths import get_benchmark_file_path, create_benchmark_directory, get_sumo_tools_directory, \
+    import_sumo_tools
+from sumo_interface import get_network, clear_network_cache, get_emergency, get_edge_id_from_gps, \
+    get_response_times, get_network_coordinate_bounds, get_config_file_path, get_network_file_path
+from loss_functions import get_mean_response_loss
+from optimization_algorithms import HillClimberOptimizationAlgorithm, EvolutionaryOptimizationAlgorithm
+from optimize import run_algorithm
+from profiling import enable_profiling, disable_profiling, reset_profiling, get_profile_statistics
+import_sumo_tools()
+import sumolib
+
+
+NETWORK_ORIGIN = (40.58, -74.15)  # the (lat, lon) the south west corner of the synthetic networks is placed at
+NETWORK_SIZES = (5, 10, 20)  # the number of junctions along each side of a grid or the number of arms of a spider
+EDGE_LENGTH = 200  # the length (in meters) of the edges in the synthetic networks
+TRAFFIC_PERIOD = 2.0  # the average time (in seconds) between the departures of background vehicles
+SIMULATION_END_TIME = 3600  # the end time (in seconds) of the background traffic
+
+
+def get_netgenerate_options(network_type, size):
+    """Returns the netgenerate options which build a network of the type with the passed size."""
+
+    if network_type == "grid":
+        return ["--grid", "--grid.number", str(size), "--grid.length", str(EDGE_LENGTH)]
+    if network_type == "spider":
+        return ["--spider",
+                "--spider.arm-number", str(size),
+                "--spider.circle-number", str(max(1, size // 2)),
+                "--spider.space-radius", str(EDGE_LENGTH),
+                "--spider.omit-center"]
+
+    raise ValueError(f"Unknown network type {network_type}, expected 'grid' or 'spider'.")
+
+
+def generate_simulation(data_directory, network_type, size, seed=0):
+    """
+    Generates a network of the passed type and size with background traffic in the data directory.
+    The directory is laid out like the downloaded simulations so it can be passed to get_response_times.
+    """
+
+    if not os.path.exists(data_directory):
+        os.makedirs(data_directory)
+    net_file_path = get_network_file_path(data_directory)
+    trips_file_path = os.path.join(data_directory, 'osm.trips.xml')
+    routes_file_path = os.path.join(data_directory, 'osm.rou.xml')
+
+    # build the network and place it on the map
+    subprocess.run([sumolib.checkBinary('netgenerate'),
+                    *get_netgenerate_options(network_type, size),
+                    "--default.speed", "13.89",
+                    "--seed", str(seed),
+                    "--output-file", net_file_path],
+                   check=True, stdout=subprocess.DEVNULL)
+    georeference_network(net_file_path)
+
+    # add random background traffic
+    subprocess.run([sys.executable,
+                    os.path.join(get_sumo_tools_directory(), 'randomTrips.py'),
+                    "--net-file", net_file_path,
+                    "--output-trip-file", trips_file_path,
+                    "--route-file", routes_file_path,
+                    "--period", str(TRAFFIC_PERIOD),
+                    "--end", str(SIMULATION_END_TIME),
+                    "--seed", str(seed),
+                    "--validate"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    with open(get_config_file_path(data_directory), 'w') as f:
+        f.write(f"""<configuration>
+    <input>
+        <net-file value="{os.path.basename(net_file_path)}"/>
+        <route-files value="{os.path.basename(routes_file_path)}"/>
+    </input>
+    <time>
+        <begin value="0"/>
+        <end value="{SIMULATION_END_TIME}"/>
+    </time>
+</configuration>
+""")
+
+
+def georeference_network(net_file_path, origin=NETWORK_ORIGIN):
+    """
+    Gives a generated network a UTM projection whose offset places the origin of the network at the passed (lat, lon).
+    Networks built by netgenerate have no projection, so without this they cannot be converted to GPS coordinates.
+    """
+
+    zone = int((origin[1] + 180) // 6) + 1
+    projection = f"+proj=utm +zone={zone} +ellps=WGS84 +datum=WGS84 +units=m +no_defs"
+    x, y = pyproj.Proj(projection)(origin[1], origin[0])
+
+    with open(net_file_path) as f:
+        network = f.read()
+    network = re.sub(r'netOffset="[^"]*"', f'netOffset="{-x:.2f},{-y:.2f}"', network, count=1)
+    network = re.sub(r'projParameter="[^"]*"', f'projParameter="{projection}"', network, count=1)
+    with open(net_file_path, 'w') as f:
+        f.write(network)
+
+
+def time_function(function, num_repeats=1):
+    """Calls the function repeatedly and returns a dictionary summarizing how long the calls took (in seconds)."""
+
+    times = []
+    for _ in range(num_repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    return {"mean": float(np.mean(times)),
+            "min": float(np.min(times)),
+            "max": float(np.max(times)),
+            "num_repeats": num_repeats}
+
+
+def benchmark_simulation(data_directory, num_stations=3, num_simulations=3, num_repeats=100, seed=0):
+    """Returns a dictionary of the timings of the simulation and optimization functions on the simulation."""
+
+    random.seed(seed)
+    net_file_path = get_network_file_path(data_directory)
+    timings = {}
+
+    # time parsing the network without and with the cache
+    def parse_network():
+        clear_network_cache()
+        get_network(net_file_path)
+
+    timings["get_network"] = time_function(parse_network, 3)
+    timings["get_network (cached)"] = time_function(lambda: get_network(net_file_path), num_repeats)
+
+    # time drawing emergencies and snapping coordinates to edges once the indexes have been built
+    (min_lat, min_lon), (max_lat, max_lon) = get_network_coordinate_bounds(net_file_path)
+    coordinates = [(random.uniform(min_lat, max_lat), random.uniform(min_lon, max_lon)) for _ in range(num_repeats)]
+    get_emergency(net_file_path)
+    get_edge_id_from_gps(net_file_path, coordinates[0])
+    timings["get_emergency"] = time_function(lambda: get_emergency(net_file_path), num_repeats)
+    timings["get_edge_id_from_gps"] = time_function(lambda: get_edge_id_from_gps(net_file_path, coordinates.pop()),
+                                                    num_repeats)
+
+    # time simulating emergencies, dividing the time by the number of emergencies simulated
+    station_coordinates = [(random.uniform(min_lat, max_lat), random.uniform(min_lon, max_lon))
+                           for _ in range(num_stations)]
+    reset_profiling()
+    enable_profiling()
+    simulation_timing = time_function(lambda: get_response_times(data_directory,
+                                                                 station_coordinates,
+                                                                 num_simulations,
+                                                                 prior_time=100,
+                                                                 max_time=1000))
+    disable_profiling()
+    timings["get_response_times (phases)"] = get_profile_statistics()["phases"]
+    timings["get_response_times (per sample)"] = {key: value / num_simulations if key != "num_repeats" else value
+                                                  for key, value in simulation_timing.items()}
+
+    # time one generation of each optimizer, excluding the evaluation of the initial placements
+    for algorithm_class in (HillClimberOptimizationAlgorithm, EvolutionaryOptimizationAlgorithm):
+        algorithm = algorithm_class(get_mean_response_loss(data_directory, num_simulations),
+                                    ((min_lat, min_lon), (max_lat, max_lon)),
+                                    num_stations=num_stations,
+                                    seed=seed)
+        timings[f"run_algorithm ({algorithm_class.__name__} generation)"] = time_function(
+            lambda: run_algorithm(algorithm, num_generations=1))
+
+    return timings
+
+
+def get_benchmark_metadata():
+    """Returns a dictionary describing the version of the code and the machine the benchmarks were run on."""
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor()}
+
+
+def run_benchmarks(network_types=("grid", "spider"), sizes=NETWORK_SIZES, num_repeats=100, num_simulations=3, seed=0):
+    """
+    Generates a network of each type and size, benchmarks it, and returns the path to the JSON file of the results.
+    Generated networks are kept in the benchmark directory and reused by later runs.
+    """
+
+    create_benchmark_directory()
+    results = {"metadata": get_benchmark_metadata(), "networks": []}
+    for network_type in network_types:
+        for size in sizes:
+            data_directory = get_benchmark_file_path(f"{network_type}_{size}")
+            if not os.path.exists(get_config_file_path(data_directory)):
+                generate_simulation(data_directory, network_type, size, seed)
+
+            net = get_network(get_network_file_path(data_directory))
+            print(f"Benchmarking the {network_type} network of size {size}...")
+            results["networks"].append({"type": network_type,
+                                        "size": size,
+                                        "num_nodes": len(net.getNodes()),
+                                        "num_edges": len(net.getEdges()),
+                                        "timings": benchmark_simulation(data_directory,
+                                                                        num_simulations=num_simulations,
+                                                                        num_repeats=num_repeats,
+                                                                        seed=seed)})
+
+    results_file_path = get_benchmark_file_path(f"results {time.strftime('%Y-%m-%d %H-%M-%S')}.json")
+    with open(results_file_path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    return results_file_path
+
+
+def main():
+    """Runs the benchmarks and prints where the results were saved."""
+
+    print(f"Saved the benchmark results to {run_benchmarks()}")
+
+
+if __name__ == "__main__":
+    main()
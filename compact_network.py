@@ -0,0 +1,201 @@
+"""
+This file provides a compact array format for road networks.
+A parsed SUMO network is a large graph of Python objects, so every process that parses one holds its own copy.
+The compact format stores the parts of the network the indexes and surrogate need as .npy arrays in a directory beside
+the network file, which are memory-mapped read-only so processes using the same network share its pages.
+"""
+
+import os
+import json
+import shutil
+
+import numpy as np
+import pyproj
+
+
+COMPACT_NETWORK_VERSION = 1  # increase when the arrays stored in the format change
+VEHICLE_CLASSES = ("private", "emergency", "authority", "army", "vip", "pedestrian", "passenger", "hov", "taxi", "bus",
+                   "coach", "delivery", "truck", "trailer", "motorcycle", "moped", "bicycle", "evehicle", "tram",
+                   "rail_urban", "rail", "rail_electric", "rail_fast", "ship", "custom1", "custom2")
+ARRAY_NAMES = ("node_ids", "node_x", "node_y", "node_latitudes", "node_longitudes",
+               "edge_ids", "edge_from_nodes", "edge_to_nodes", "edge_lengths", "edge_speeds", "edge_permissions",
+               "adjacency_offsets", "adjacency_edges", "shape_offsets", "shape_x", "shape_y")
+
+
+def get_permission_bit(vehicle_class):
+    """Returns the bit of the permission bitmask which is set when an edge allows the vehicle class."""
+
+    return np.uint32(1 << VEHICLE_CLASSES.index(vehicle_class))
+
+
+def save_compact_network(net, directory, source_file_path=None):
+    """
+    Writes the arrays of the compact format of the parsed network to the directory.
+    If the path of the network file is passed, its modification time is recorded so stale conversions can be detected.
+    The arrays are written to a temporary directory which is then renamed to the directory, so processes converting the
+    same network at the same time never load a partly written conversion.
+    A conversion is never modified once it is in place, so if another process has already put the directory in place
+    this conversion is discarded.
+    """
+
+    temporary_directory = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(temporary_directory, exist_ok=True)
+    nodes = net.getNodes()
+    edges = net.getEdges()
+    node_positions = {node.getID(): i for i, node in enumerate(nodes)}
+
+    # store the nodes in projected and GPS coordinates
+    node_coordinates = np.array([node.getCoord()[:2] for node in nodes], dtype=float).reshape(-1, 2)
+    projection = net.getGeoProj().srs if net.hasGeoProj() else None
+    x_offset, y_offset = net.getLocationOffset()
+    if projection is not None:
+        longitudes, latitudes = pyproj.Proj(projection)(node_coordinates[:, 0] - x_offset,
+                                                        node_coordinates[:, 1] - y_offset,
+                                                        inverse=True)
+    else:
+        longitudes = latitudes = np.full(len(nodes), np.nan)
+
+    # store the edges along with the permission of each vehicle class to use them
+    edge_from_nodes = np.array([node_positions[edge.getFromNode().getID()] for edge in edges], dtype=np.int32)
+    permissions = np.zeros(len(edges), dtype=np.uint32)
+    for vehicle_class in VEHICLE_CLASSES:
+        allowed = np.array([edge.allows(vehicle_class) for edge in edges], dtype=bool)
+        permissions[allowed] |= get_permission_bit(vehicle_class)
+
+    # store the outgoing edges of each node as compressed sparse rows and the shapes of the edges end to end
+    adjacency_edges = np.argsort(edge_from_nodes, kind='stable').astype(np.int32)
+    shapes = [np.array([point[:2] for point in edge.getShape()], dtype=float).reshape(-1, 2) for edge in edges]
+
+    arrays = {"node_ids": np.array([node.getID() for node in nodes], dtype=str),
+              "node_x": node_coordinates[:, 0],
+              "node_y": node_coordinates[:, 1],
+              "node_latitudes": np.asarray(latitudes, dtype=float),
+              "node_longitudes": np.asarray(longitudes, dtype=float),
+              "edge_ids": np.array([edge.getID() for edge in edges], dtype=str),
+              "edge_from_nodes": edge_from_nodes,
+              "edge_to_nodes": np.array([node_positions[edge.getToNode().getID()] for edge in edges], dtype=np.int32),
+              "edge_lengths": np.array([edge.getLength() for edge in edges], dtype=float),
+              "edge_speeds": np.array([edge.getSpeed() for edge in edges], dtype=float),
+              "edge_permissions": permissions,
+              "adjacency_offsets": np.searchsorted(edge_from_nodes[adjacency_edges], np.arange(len(nodes) + 1)),
+              "adjacency_edges": adjacency_edges,
+              "shape_offsets": np.cumsum([0] + [len(shape) for shape in shapes]),
+              "shape_x": np.concatenate([shape[:, 0] for shape in shapes]) if shapes else np.zeros(0),
+              "shape_y": np.concatenate([shape[:, 1] for shape in shapes]) if shapes else np.zeros(0)}
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary_directory, f"{name}.npy"), array)
+
+    metadata = {"version": COMPACT_NETWORK_VERSION,
+                "projection": projection,
+                "location_offset": [x_offset, y_offset],
+                "bounding_box": [list(corner[:2]) for corner in net.getBBoxXY()],
+                "source_modification_time": os.path.getmtime(source_file_path) if source_file_path else None}
+    with open(os.path.join(temporary_directory, "metadata.json"), 'w') as f:
+        json.dump(metadata, f)
+
+    # put the conversion in place, discarding it if another process has just done the same
+    try:
+        os.rename(temporary_directory, directory)
+    except OSError:
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+
+
+class CompactNetwork:
+    """
+    This class provides read-only memory-mapped arrays of a network saved in the compact format.
+    The nodes and edges are identified by their positions in the arrays.
+    getGeoProj and getLocationOffset match the methods of a parsed SUMO network so the coordinate conversions of the
+    network indexes accept either.
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        with open(os.path.join(directory, "metadata.json")) as f:
+            self.metadata = json.load(f)
+        for name in ARRAY_NAMES:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r'))
+        self.projection = None
+
+    def getGeoProj(self):
+        if self.metadata["projection"] is None:
+            raise ValueError(f"The network in {self.directory} has no geographic projection.")
+        if self.projection is None:
+            self.projection = pyproj.Proj(self.metadata["projection"])
+        return self.projection
+
+    def getLocationOffset(self):
+        return tuple(self.metadata["location_offset"])
+
+    def get_bounding_box(self):
+        """Returns a tuple of the (x, y) of the lower left and upper right corners of the network."""
+
+        (min_x, min_y), (max_x, max_y) = self.metadata["bounding_box"]
+
+        return (min_x, min_y), (max_x, max_y)
+
+    def get_allowed_edges(self, vehicle_class):
+        """Returns an array of the positions of the edges which allow the vehicle class."""
+
+        return np.flatnonzero(self.edge_permissions & get_permission_bit(vehicle_class))
+
+    def get_outgoing_edges(self, node):
+        """Returns an array of the positions of the edges leaving the node at the passed position."""
+
+        return self.adjacency_edges[self.adjacency_offsets[node]:self.adjacency_offsets[node + 1]]
+
+    def get_edge_shape(self, edge):
+        """Returns an (N, 2) array of the (x, y) points along the shape of the edge at the passed position."""
+
+        start, end = self.shape_offsets[edge], self.shape_offsets[edge + 1]
+
+        return np.column_stack((self.shape_x[start:end], self.shape_y[start:end]))
+
+
+def get_compact_network_directory(network_file_path):
+    """
+    Returns the path to the directory holding the compact format of the current version of the network.
+    The name includes the version of the format and the modification time of the network file, so a conversion which
+    other processes may be loading is never replaced.
+    """
+
+    modification_time = os.stat(network_file_path).st_mtime_ns
+
+    return f"{network_file_path}.v{COMPACT_NETWORK_VERSION}.{modification_time}.arrays"
+
+
+def remove_stale_compact_networks(network_file_path):
+    """
+    Deletes the conversions of older versions of the network or of the format.
+    Each one is renamed aside before it is deleted, so no process can find it partly deleted.
+    """
+
+    current_directory = get_compact_network_directory(network_file_path)
+    prefix = os.path.basename(network_file_path) + '.'
+    parent_directory = os.path.dirname(network_file_path) or '.'
+    for name in os.listdir(parent_directory):
+        directory = os.path.join(parent_directory, name)
+        if name.startswith(prefix) and name.endswith('.arrays') and directory != current_directory:
+            removed_directory = f"{directory}.{os.getpid()}.removed"
+            try:
+                os.rename(directory, removed_directory)
+            except OSError:
+                continue  # another process is removing it
+            shutil.rmtree(removed_directory, ignore_errors=True)
+
+
+def load_compact_network(network_file_path):
+    """Returns the compact format of the network or None if there is no up to date conversion."""
+
+    directory = get_compact_network_directory(network_file_path)
+    metadata_file_path = os.path.join(directory, "metadata.json")
+    if not os.path.exists(metadata_file_path):
+        return None
+
+    with open(metadata_file_path) as f:
+        metadata = json.load(f)
+    if metadata["version"] != COMPACT_NETWORK_VERSION or \
+            metadata["source_modification_time"] != os.path.getmtime(network_file_path):
+        return None
+
+    return CompactNetwork(directory)
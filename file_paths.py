@@ -8,6 +8,8 @@ import sys
 
 
 OUTPUT_DIRECTORY = "plots"
+CACHE_DIRECTORY = "cache"
+BENCHMARK_DIRECTORY = "benchmarks"
 POLICE_DATA_DIRECTORY = "police_data"
 SIMULATION_DATA_DIRECTORY = "sumo_data"
 
@@ -24,11 +26,29 @@ def get_simulation_data_file_path(sim_name):
     return os.path.join(SIMULATION_DATA_DIRECTORY, sim_name)
 
 
+def get_cache_file_path(file_name):
+    return os.path.join(CACHE_DIRECTORY, file_name)
+
+
+def get_benchmark_file_path(file_name):
+    return os.path.join(BENCHMARK_DIRECTORY, file_name)
+
+
 def create_output_directory():
     if not os.path.exists(OUTPUT_DIRECTORY):
         os.mkdir(OUTPUT_DIRECTORY)
 
 
+def create_cache_directory():
+    if not os.path.exists(CACHE_DIRECTORY):
+        os.mkdir(CACHE_DIRECTORY)
+
+
+def create_benchmark_directory():
+    if not os.path.exists(BENCHMARK_DIRECTORY):
+        os.mkdir(BENCHMARK_DIRECTORY)
+
+
 def get_sumo_directory():
     if 'SUMO_HOME' in os.environ:
         sumo_directory = os.environ['SUMO_HOME']
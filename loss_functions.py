@@ -2,70 +2,591 @@
 This file contains the loss functions.
 Each loss function takes the station coordinates as input.
 Each function provides a loss value as output.
+Each loss function factory optionally takes a SimulationPool which is used to run the simulations in parallel.
+The loss functions also provide evaluate_batch, which takes a list of station coordinates and returns a list of losses.
+evaluate_batch_with_samples additionally returns the response times simulated for each loss.
+Any loss function can be wrapped in a MemoizedLoss so that repeated station placements are not evaluated again.
+Loss functions built by get_shared_sample_losses simulate each placement once for all of the response time statistics.
+With delta evaluation they only simulate the emergencies whose dispatching station changed since an earlier placement.
+Loss functions built by get_surrogate_losses estimate response times from the road network graph without running SUMO.
 """
 
+import os
+import shelve
+from collections import OrderedDict
+
 import numpy as np
+from scipy import stats
 
-from sumo_interface import get_response_times
+from sumo_interface import get_response_times, get_edge_ids_from_gps, get_closest_stations, get_network_file_path
+from travel_time_surrogate import TravelTimeSurrogate
 
 
-def get_mean_response_loss(simulation_directory, num_simulations=100):
-    """Returns a loss function that computes the mean response time over a specified number of simulated emergencies."""
+class ResponseTimeSampler:
+    """
+    This class simulates the response times to emergencies for station placements.
+    Several loss functions can share one sampler so that each placement is only simulated once for all of them.
+    The response times of the most recently simulated placements are cached when cache_size is positive.
+    If a ScenarioBank is passed, every placement is simulated on the same scenarios (common random numbers).
+    """
 
-    def mean_response_loss(placements):
-        response_times = get_response_times(simulation_directory,
-                                            placements,
-                                            num_simulations,
-                                            prior_time=100,
-                                            max_time=1000)
-        mean_response_time = sum(response_times) / len(response_times)
-        return mean_response_time
+    def __init__(self, simulation_directory, num_simulations=100, pool=None, cache_size=0, scenarios=None):
 
-    return mean_response_loss
+        self.simulation_directory = simulation_directory
+        self.num_simulations = num_simulations
+        self.pool = pool
+        self.cache_size = cache_size
+        self.scenarios = scenarios
+        self.cache = OrderedDict()
 
+    def get_response_times(self, placements):
+        """Returns the response times to the simulated emergencies for the placements."""
 
-def get_median_response_loss(simulation_directory, num_simulations=100):
-    """Returns a loss function that computes the median response time to the simulated emergencies."""
+        return self.get_batch_response_times([placements])[0]
 
-    def median_loss(placements):
-        response_times = get_response_times(simulation_directory,
-                                            placements,
-                                            num_simulations,
-                                            prior_time=100,
-                                            max_time=1000)
-        response_times = np.array(response_times)
-        median = np.median(response_times)
-        return median
+    def get_batch_response_times(self, placement_sets):
+        """Returns the response times of each set of placements, simulating them concurrently when there is a pool."""
 
-    return median_loss
+        return self.get_batch_samples(placement_sets)[0]
 
+    def get_batch_samples(self, placement_sets):
+        """
+        Returns a list of the response times of each set of placements and a list of whether each set was simulated by
+        this call (rather than taken from the cache or repeating an earlier set in the batch).
+        """
 
-def get_max_95_percentile_response_loss(simulation_directory, num_simulations=100):
-    """Returns a loss function that computes the max 95th percentile response time to the simulated emergencies."""
+        # find the placements that have not been simulated recently
+        keys = [tuple(tuple(placement) for placement in placements) for placements in placement_sets]
+        missing_keys = [key for key in OrderedDict.fromkeys(keys) if key not in self.cache]
+        first_indices = {}
+        for i, key in enumerate(keys):
+            first_indices.setdefault(key, i)
+        simulated_indices = {first_indices[key] for key in missing_keys}
+
+        # simulate the missing placements
+        missing_response_times = self.simulate([list(key) for key in missing_keys], self.num_simulations)
+
+        # combine the simulated and cached response times
+        batch_response_times = dict(zip(missing_keys, missing_response_times))
+        for key in keys:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                batch_response_times[key] = self.cache[key]
+        for key, response_times in zip(missing_keys, missing_response_times):
+            self.cache[key] = response_times
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return [batch_response_times[key] for key in keys], [i in simulated_indices for i in range(len(keys))]
+
+    def simulate(self, placement_sets, num_simulations, offset=0):
+        """
+        Simulates the number of emergencies for each set of placements without using the cache.
+        With a scenario bank, the scenarios starting at the offset are simulated.
+        """
+
+        scenarios = None
+        if self.scenarios is not None:
+            scenarios = self.scenarios[offset:offset + num_simulations]
+
+        if self.pool is not None:
+            return self.pool.get_batch_response_times(self.simulation_directory,
+                                                      placement_sets,
+                                                      num_simulations,
+                                                      prior_time=100,
+                                                      max_time=5000,
+                                                      scenarios=scenarios)
+
+        return [get_response_times(self.simulation_directory,
+                                   placements,
+                                   num_simulations,
+                                   prior_time=100,
+                                   max_time=5000,
+                                   scenarios=scenarios)
+                for placements in placement_sets]
+
+    @property
+    def deterministic(self):
+        """Returns whether simulating the same placements always gives the same response times."""
+
+        return self.scenarios is not None
+
+    def get_statistics(self, placements, statistics=None):
+        """Returns a dictionary mapping the name of each response time statistic to its value for the placements."""
+
+        statistics = statistics or RESPONSE_TIME_STATISTICS
+        response_times = self.get_response_times(placements)
+
+        return {name: statistic(response_times) for name, statistic in statistics.items()}
+
+
+class DeltaResponseTimeSampler(ResponseTimeSampler):
+    """
+    This class simulates the scenarios of a scenario bank one emergency at a time and remembers the response time to
+    each scenario from each station edge.
+    A placement only needs the emergencies whose nearest station is on an edge that has not responded to them before to
+    be simulated, so when a single station moves only the emergencies it gains are simulated again.
+    Each emergency must be simulated in its own simulation (the default of get_response_times) for its response time
+    to be independent of the other stations.
+    """
+
+    def __init__(self,
+                 simulation_directory,
+                 scenarios,
+                 num_simulations=100,
+                 pool=None,
+                 cache_size=0,
+                 emergency_cache_size=100000):
+
+        super().__init__(simulation_directory, num_simulations, pool, cache_size, scenarios)
+        self.network_file_path = get_network_file_path(simulation_directory)
+        self.emergency_cache_size = emergency_cache_size
+        self.emergency_cache = OrderedDict()  # maps a tuple of (scenario index, station edge) to a response time
+        self.num_simulated_emergencies = 0
+        self.num_reused_emergencies = 0
+
+    def simulate(self, placement_sets, num_simulations, offset=0):
+        """
+        Returns the response times to the scenarios starting at the offset for each set of placements, only simulating
+        the emergencies whose response time from the dispatching station edge is not already known.
+        """
+
+        if offset + num_simulations > len(self.scenarios):
+            raise ValueError(f"Scenarios {offset} to {offset + num_simulations} were requested but the scenario bank "
+                             f"only contains {len(self.scenarios)} scenarios.")
+        scenario_indices = np.arange(offset, offset + num_simulations)
+        scenarios = self.scenarios[scenario_indices]
+        emergency_coordinates = np.column_stack((scenarios.latitudes, scenarios.longitudes))
+
+        # find the edge of the station dispatched to each emergency and group the unknown emergencies by station edge
+        batch_keys = []
+        missing = OrderedDict()  # maps a station edge to a tuple of (station coordinates, list of scenario indices)
+        for placements in placement_sets:
+            station_indices, _ = get_closest_stations(emergency_coordinates, placements)
+            station_edges = get_edge_ids_from_gps(self.network_file_path, placements)
+            keys = [(int(scenario_index), station_edges[station_index])
+                    for scenario_index, station_index in zip(scenario_indices, station_indices)]
+            for (scenario_index, station_edge), station_index in zip(keys, station_indices):
+                if (scenario_index, station_edge) in self.emergency_cache:
+                    self.num_reused_emergencies += 1
+                else:
+                    _, missing_indices = missing.setdefault(station_edge, (placements[station_index], []))
+                    if scenario_index not in missing_indices:
+                        missing_indices.append(scenario_index)
+            batch_keys.append(keys)
+
+        # simulate the unknown emergencies from each station edge
+        for station_edge, (station_coordinates, missing_indices) in missing.items():
+            response_times = self.simulate_emergencies(station_coordinates, missing_indices)
+            for scenario_index, response_time in zip(missing_indices, response_times):
+                self.emergency_cache[(scenario_index, station_edge)] = response_time
+            self.num_simulated_emergencies += len(missing_indices)
+
+        # combine the response times before evicting the least recently used ones so none of the batch is lost
+        batch_response_times = []
+        for keys in batch_keys:
+            for key in keys:
+                self.emergency_cache.move_to_end(key)
+            batch_response_times.append([self.emergency_cache[key] for key in keys])
+        while len(self.emergency_cache) > self.emergency_cache_size:
+            self.emergency_cache.popitem(last=False)
+
+        return batch_response_times
+
+    def simulate_emergencies(self, station_coordinates, scenario_indices):
+        """Returns the response times to the scenarios from a single station."""
+
+        scenarios = self.scenarios[np.asarray(scenario_indices)]
+        if self.pool is not None:
+            return self.pool.get_batch_response_times(self.simulation_directory,
+                                                      [[station_coordinates]],
+                                                      len(scenario_indices),
+                                                      prior_time=100,
+                                                      max_time=5000,
+                                                      scenarios=scenarios)[0]
+
+        return get_response_times(self.simulation_directory,
+                                  [station_coordinates],
+                                  len(scenario_indices),
+                                  prior_time=100,
+                                  max_time=5000,
+                                  scenarios=scenarios)
+
+
+class ResponseTimeLoss:
+    """
+    This class computes a statistic of the response times to simulated emergencies.
+    Calling it with station coordinates returns the loss, and evaluate_batch returns the losses of many placements.
+    """
+
+    def __init__(self, simulation_directory, statistic, num_simulations=100, pool=None, sampler=None):
+
+        self.statistic = statistic
+        self.sampler = sampler or ResponseTimeSampler(simulation_directory, num_simulations, pool)
+
+    def __call__(self, placements):
+        return self.statistic(self.sampler.get_response_times(placements))
+
+    @property
+    def simulation_directory(self):
+        return self.sampler.simulation_directory
+
+    @property
+    def deterministic(self):
+        """Returns whether the loss of the same placements is always the same, so it can be remembered between runs."""
+
+        return getattr(self.sampler, 'deterministic', False)
+
+    @property
+    def parameters(self):
+        """
+        Returns a tuple of the parameters that determine the value of the loss.
+        The modification time of the network and a hash of the scenarios are included, so losses remembered for an
+        older version of the network or of the scenario bank are not reused.
+        """
+
+        scenarios = getattr(self.sampler, 'scenarios', None)
+        network_file_path = get_network_file_path(self.sampler.simulation_directory)
+
+        return (type(self.sampler).__name__,
+                self.sampler.simulation_directory,
+                self.statistic.__name__,
+                self.sampler.num_simulations,
+                scenarios.seed if scenarios is not None else None,
+                scenarios.digest if scenarios is not None else None,
+                os.path.getmtime(network_file_path) if os.path.exists(network_file_path) else None,
+                getattr(self.sampler, 'speed_factor', None))
+
+    def evaluate_batch(self, placement_sets):
+        """Returns the loss of each set of placements, simulating them concurrently when there is a pool."""
+
+        return self.evaluate_batch_with_samples(placement_sets)[0]
+
+    def evaluate_batch_with_samples(self, placement_sets):
+        """
+        Returns a list of the loss of each set of placements and a list of the response times simulated for them.
+        The response times are empty for placements whose response times were cached by the sampler (or repeat an
+        earlier set in the batch), so each simulated response time is only returned once.
+        """
+
+        if hasattr(self.sampler, 'get_batch_samples'):
+            batch_response_times, simulated = self.sampler.get_batch_samples(placement_sets)
+        else:
+            batch_response_times = self.sampler.get_batch_response_times(placement_sets)
+            simulated = [True] * len(placement_sets)
+        losses = [self.statistic(response_times) for response_times in batch_response_times]
+
+        return losses, [response_times if is_simulated else []
+                        for response_times, is_simulated in zip(batch_response_times, simulated)]
+
+    def race(self, placements, threshold, confidence=0.95, chunk_size=5, max_simulations=None):
+        """
+        Evaluates the placements in chunks of simulations, stopping as soon as a sequential test shows the loss is above
+        or below the threshold (usually the loss of the current best placements) at the passed confidence.
+        While the loss is too close to the threshold to call, sampling continues past num_simulations up to
+        max_simulations (twice num_simulations by default, and no more than the size of the sampler's scenario bank).
+        Returns a tuple of the loss, the number of simulations run, and whether the loss is below the threshold.
+        """
+
+        loss, response_times, is_below = self.race_with_samples(placements,
+                                                                threshold,
+                                                                confidence,
+                                                                chunk_size,
+                                                                max_simulations)
+
+        return loss, len(response_times), is_below
+
+    def race_with_samples(self, placements, threshold, confidence=0.95, chunk_size=5, max_simulations=None):
+        """
+        Races the placements like race, but returns a tuple of the loss, the response times simulated, and whether the
+        loss is below the threshold.
+        """
+
+        max_simulations = max_simulations or 2 * self.sampler.num_simulations
+        if getattr(self.sampler, 'scenarios', None) is not None:
+            max_simulations = min(max_simulations, len(self.sampler.scenarios))
+        z = stats.norm.ppf(confidence)
+        response_times = []
+        while True:
+            num_simulations = min(chunk_size, max_simulations - len(response_times))
+            response_times.extend(self.sampler.simulate([placements], num_simulations, len(response_times))[0])
+            loss = self.statistic(response_times)
+            if len(response_times) >= max_simulations:
+                break
+
+            # stop once the confidence interval of the loss no longer contains the threshold
+            standard_error = get_standard_error(response_times, self.statistic)
+            if loss - z * standard_error > threshold or loss + z * standard_error < threshold:
+                break
+
+        return loss, response_times, bool(loss < threshold)
+
+
+def mean_response_time(response_times):
+    """Returns the mean of the response times."""
+
+    return sum(response_times) / len(response_times)
+
+
+def median_response_time(response_times):
+    """Returns the median of the response times."""
+
+    return np.median(np.array(response_times))
+
+
+def max_95_percentile_response_time(response_times):
+    """Returns the 95th percentile of the response times."""
 
-    def max_95_percentile_response_loss(placements):
-        response_times = get_response_times(simulation_directory,
-                                            placements,
-                                            num_simulations,
-                                            prior_time=100,
-                                            max_time=1000)
-        response_times = np.array(response_times)
-        max_95_percentile = np.percentile(response_times, 95)
-        return max_95_percentile
+    return np.percentile(np.array(response_times), 95)
 
-    return max_95_percentile_response_loss
 
+def max_response_time(response_times):
+    """Returns the maximum of the response times."""
 
-def get_max_loss(simulation_directory, num_simulations=100):
+    return max(response_times)
+
+
+def get_standard_error(response_times, statistic, num_resamples=200):
+    """
+    Returns the standard error of the statistic of the response times.
+    The standard error of the mean is computed directly and the standard error of other statistics is bootstrapped.
+    """
+
+    response_times = np.asarray(response_times, dtype=float)
+    if len(response_times) < 2:
+        return np.inf
+    if statistic is mean_response_time:
+        return np.std(response_times, ddof=1) / np.sqrt(len(response_times))
+
+    rng = np.random.default_rng(0)
+    resamples = response_times[rng.integers(0, len(response_times), (num_resamples, len(response_times)))]
+
+    return np.std([statistic(resample) for resample in resamples], ddof=1)
+
+
+RESPONSE_TIME_STATISTICS = OrderedDict([("Mean Response Time", mean_response_time),
+                                        ("Median Response Time", median_response_time),
+                                        ("Max 95th Percentile Response Time", max_95_percentile_response_time),
+                                        ("Max Response Time", max_response_time)])
+
+
+def get_mean_response_loss(simulation_directory, num_simulations=100, pool=None):
+    """Returns a loss function that computes the mean response time over a specified number of simulated emergencies."""
+
+    return ResponseTimeLoss(simulation_directory, mean_response_time, num_simulations, pool)
+
+
+def get_median_response_loss(simulation_directory, num_simulations=100, pool=None):
+    """Returns a loss function that computes the median response time to the simulated emergencies."""
+
+    return ResponseTimeLoss(simulation_directory, median_response_time, num_simulations, pool)
+
+
+def get_max_95_percentile_response_loss(simulation_directory, num_simulations=100, pool=None):
+    """Returns a loss function that computes the max 95th percentile response time to the simulated emergencies."""
+
+    return ResponseTimeLoss(simulation_directory, max_95_percentile_response_time, num_simulations, pool)
+
+
+def get_max_loss(simulation_directory, num_simulations=100, pool=None):
     """Returns a loss function that computes the maximum response time to the simulated emergencies."""
 
-    def max_loss(placements):
-        response_times = get_response_times(simulation_directory,
-                                            placements,
-                                            num_simulations,
-                                            prior_time=100,
-                                            max_time=1000)
-        max_response_time = max(response_times)
-        return max_response_time
+    return ResponseTimeLoss(simulation_directory, max_response_time, num_simulations, pool)
+
+
+def get_shared_sample_losses(simulation_directory,
+                             num_simulations=100,
+                             pool=None,
+                             cache_size=1000,
+                             scenarios=None,
+                             delta_evaluation=False):
+    """
+    Returns a dictionary mapping the name of each response time statistic to a loss function computing it.
+    The loss functions share one sampler, so a placement evaluated by several of them is only simulated once.
+    If a ScenarioBank is passed, every placement is evaluated on the same scenarios.
+    If delta_evaluation is True (which requires a ScenarioBank), the response time to each scenario from each station
+    edge is remembered, so only the emergencies whose dispatching station changed are simulated again.
+    """
+
+    if delta_evaluation:
+        if scenarios is None:
+            raise ValueError("Delta evaluation requires a scenario bank.")
+        sampler = DeltaResponseTimeSampler(simulation_directory, scenarios, num_simulations, pool, cache_size)
+    else:
+        sampler = ResponseTimeSampler(simulation_directory, num_simulations, pool, cache_size, scenarios)
+
+    return OrderedDict((name, ResponseTimeLoss(simulation_directory, statistic, sampler=sampler))
+                       for name, statistic in RESPONSE_TIME_STATISTICS.items())
+
+
+def get_surrogate_losses(simulation_directory, num_emergencies=None, speed_factor=1.5):
+    """
+    Returns a dictionary mapping the name of each response time statistic to a loss function computing it.
+    The response times are estimated with shortest paths through the road network instead of simulations in SUMO.
+    """
+
+    surrogate = TravelTimeSurrogate(simulation_directory, num_emergencies, speed_factor)
+
+    return OrderedDict((name, ResponseTimeLoss(simulation_directory, statistic, sampler=surrogate))
+                       for name, statistic in RESPONSE_TIME_STATISTICS.items())
+
+
+class MemoizedLoss:
+    """
+    This class wraps a loss function and remembers the loss of each station placement it has evaluated.
+    Placements are identified by the edges their stations snap to, so placements that differ only slightly (or only in
+    the order of their stations) share a loss.
+    The losses are kept in a least recently used cache and can optionally be persisted to a file between runs.
+    Only deterministic losses (simulated on a scenario bank or estimated by the surrogate) can be persisted, since the
+    seed only labels the losses and a single noisy evaluation would otherwise be reused as if it were reproducible.
+    """
+
+    def __init__(self,
+                 loss_function,
+                 network_file_path=None,
+                 cache_size=10000,
+                 cache_file_path=None,
+                 seed=None,
+                 parameters=None):
+
+        if network_file_path is None:
+            network_file_path = get_network_file_path(loss_function.simulation_directory)
+        if parameters is None:
+            parameters = getattr(loss_function, 'parameters', ())
+        if cache_file_path and not getattr(loss_function, 'deterministic', False):
+            raise ValueError("Only deterministic losses can be persisted, simulate the placements on a scenario "
+                             "bank or use the surrogate.")
+        self.loss_function = loss_function
+        self.network_file_path = network_file_path
+        self.cache_size = cache_size
+        self.seed = seed
+        self.parameters = parameters
+        self.cache = OrderedDict()
+        self.store = shelve.open(cache_file_path) if cache_file_path else None
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def __call__(self, placements):
+        return self.evaluate_batch([placements])[0]
+
+    def evaluate_batch(self, placement_sets):
+        """Returns the loss of each set of placements, only evaluating the placements that have not been seen before."""
+
+        return self.evaluate_batch_with_samples(placement_sets)[0]
+
+    def evaluate_batch_with_samples(self, placement_sets):
+        """
+        Returns a list of the loss of each set of placements and a list of the response times simulated for them.
+        The response times are empty for placements whose loss was remembered (or evaluated earlier in the batch) and
+        for loss functions that do not provide their response times.
+        """
+
+        # look up the placements that have already been evaluated
+        keys = [self.get_key(placements) for placements in placement_sets]
+        losses = {key: self.lookup(key) for key in set(keys)}
+        missing_keys = [key for key, loss in losses.items() if loss is None]
+        self.num_hits += len(keys) - len(missing_keys)
+        self.num_misses += len(missing_keys)
+
+        # evaluate one placement for each key that has not been seen before
+        samples = {}
+        if missing_keys:
+            missing_placements = [placement_sets[keys.index(key)] for key in missing_keys]
+            missing_samples = [[] for _ in missing_keys]
+            if hasattr(self.loss_function, 'evaluate_batch_with_samples'):
+                missing_losses, missing_samples = self.loss_function.evaluate_batch_with_samples(missing_placements)
+            elif hasattr(self.loss_function, 'evaluate_batch'):
+                missing_losses = self.loss_function.evaluate_batch(missing_placements)
+            else:
+                missing_losses = [self.loss_function(placements) for placements in missing_placements]
+            for key, loss, response_times in zip(missing_keys, missing_losses, missing_samples):
+                losses[key] = loss
+                samples[keys.index(key)] = response_times
+                self.remember(key, loss)
+
+        return [losses[key] for key in keys], [samples.get(i, []) for i in range(len(keys))]
+
+    def race(self, placements, threshold, confidence=0.95, chunk_size=5, max_simulations=None):
+        """
+        Races the placements against the threshold with the wrapped loss (see ResponseTimeLoss.race) unless their loss
+        has been remembered, in which case no simulations are run.
+        Returns a tuple of the loss, the number of simulations run, and whether the loss is below the threshold.
+        """
+
+        loss, response_times, is_below = self.race_with_samples(placements,
+                                                                threshold,
+                                                                confidence,
+                                                                chunk_size,
+                                                                max_simulations)
+
+        return loss, len(response_times), is_below
+
+    def race_with_samples(self, placements, threshold, confidence=0.95, chunk_size=5, max_simulations=None):
+        """
+        Races the placements like race, but returns a tuple of the loss, the response times simulated, and whether the
+        loss is below the threshold.
+        Raced losses are remembered separately from fully evaluated losses and are not persisted, since where a race
+        stops depends on its threshold.
+        """
+
+        if not hasattr(self.loss_function, 'race_with_samples'):
+            raise ValueError(f"{type(self.loss_function).__name__} does not support racing.")
+
+        # a fully evaluated loss is preferred over a raced one
+        key = self.get_key(placements)
+        raced_key = key + ("raced",)
+        loss = self.lookup(key)
+        if loss is None:
+            loss = self.lookup(raced_key)
+        if loss is not None:
+            self.num_hits += 1
+            return loss, [], bool(loss < threshold)
+
+        self.num_misses += 1
+        loss, response_times, is_below = self.loss_function.race_with_samples(placements,
+                                                                              threshold,
+                                                                              confidence,
+                                                                              chunk_size,
+                                                                              max_simulations)
+        self.remember(raced_key, loss, persist=False)
+
+        return loss, response_times, is_below
+
+    def get_key(self, placements):
+        """Returns the key identifying the placements, which is independent of the order of the stations."""
+
+        edges = sorted(get_edge_ids_from_gps(self.network_file_path, placements))
+
+        return tuple(edges), self.seed, self.parameters
+
+    def lookup(self, key):
+        """Returns the remembered loss for the key or None if it has not been evaluated."""
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        if self.store is not None and repr(key) in self.store:
+            loss = self.store[repr(key)]
+            self.remember(key, loss, persist=False)
+            return loss
+
+        return None
+
+    def remember(self, key, loss, persist=True):
+        """Stores the loss of the key and evicts the least recently used losses."""
+
+        self.cache[key] = loss
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        if persist and self.store is not None:
+            self.store[repr(key)] = loss
+            self.store.sync()
+
+    def close(self):
+        """Closes the persistent store of losses."""
 
-    return max_loss
+        if self.store is not None:
+            self.store.close()
+            self.store = None
@@ -0,0 +1,216 @@
+"""
+This file contains array based indexes over the road network.
+The indexes are built once from a parsed network so repeated queries avoid Python loops over the network objects.
+"""
+
+import random
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from compact_network import CompactNetwork
+
+
+def convert_xy_to_lat_lon(net, x, y):
+    """Converts arrays of network XY coordinates to arrays of latitudes and longitudes."""
+
+    x_offset, y_offset = net.getLocationOffset()
+    longitudes, latitudes = net.getGeoProj()(np.asarray(x) - x_offset, np.asarray(y) - y_offset, inverse=True)
+
+    return np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+
+
+def convert_lat_lon_to_xy(net, latitudes, longitudes):
+    """Converts arrays of latitudes and longitudes to arrays of network XY coordinates."""
+
+    x_offset, y_offset = net.getLocationOffset()
+    x, y = net.getGeoProj()(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+
+    return np.asarray(x, dtype=float) + x_offset, np.asarray(y, dtype=float) + y_offset
+
+
+def get_emergency_edges(net):
+    """Returns a list of the edges in the network which support emergency vehicles."""
+
+    edges = [edge for edge in net.getEdges() if edge.allows("emergency")]
+    if not edges:
+        raise ValueError("The network contains no edges that support emergency vehicles.")
+
+    return edges
+
+
+def get_emergency_edge_ends(net):
+    """
+    Returns arrays of the IDs of the edges which support emergency vehicles and the x, y, latitude, and longitude of the
+    nodes at their ends.
+    The network can be a parsed SUMO network or a CompactNetwork.
+    """
+
+    if isinstance(net, CompactNetwork):
+        positions = net.get_allowed_edges("emergency")
+        if len(positions) == 0:
+            raise ValueError("The network contains no edges that support emergency vehicles.")
+        nodes = net.edge_to_nodes[positions]
+        return (net.edge_ids[positions].astype(object),
+                np.asarray(net.node_x[nodes]),
+                np.asarray(net.node_y[nodes]),
+                np.asarray(net.node_latitudes[nodes]),
+                np.asarray(net.node_longitudes[nodes]))
+
+    edges = get_emergency_edges(net)
+    edge_ids = np.array([edge.getID() for edge in edges], dtype=object)
+    coordinates = np.array([edge.getToNode().getCoord()[:2] for edge in edges], dtype=float)
+    x, y = coordinates[:, 0], coordinates[:, 1]
+
+    return (edge_ids, x, y, *convert_xy_to_lat_lon(net, x, y))
+
+
+def get_emergency_edge_shapes(net):
+    """
+    Returns an array of the IDs of the edges which support emergency vehicles and a list of an (N, 2) array of the
+    points along the shape of each one.
+    The network can be a parsed SUMO network or a CompactNetwork.
+    """
+
+    if isinstance(net, CompactNetwork):
+        positions = net.get_allowed_edges("emergency")
+        if len(positions) == 0:
+            raise ValueError("The network contains no edges that support emergency vehicles.")
+        return net.edge_ids[positions].astype(object), [net.get_edge_shape(position) for position in positions]
+
+    edges = get_emergency_edges(net)
+
+    return (np.array([edge.getID() for edge in edges], dtype=object),
+            [np.array([point[:2] for point in edge.getShape()], dtype=float) for edge in edges])
+
+
+def get_random_generator(rng=None):
+    """
+    Returns a NumPy random generator.
+    If none is passed, the generator is seeded from the random module so that random.seed keeps results reproducible.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(32))
+
+    return rng
+
+
+class EmergencyEdgeIndex:
+    """
+    This class stores the edges emergency vehicles can travel on as arrays so emergencies can be drawn in batches.
+    It can be built from a parsed SUMO network or a CompactNetwork.
+    """
+
+    def __init__(self, net, demand_weights=None):
+
+        # store the ID and the coordinates of the node at the end of each edge
+        self.edge_ids, self.x, self.y, self.latitudes, self.longitudes = get_emergency_edge_ends(net)
+        self.edge_positions = {edge_id: i for i, edge_id in enumerate(self.edge_ids)}
+
+        self.probabilities = None
+        if demand_weights is not None:
+            self.set_demand_weights(demand_weights)
+
+    def __len__(self):
+        return len(self.edge_ids)
+
+    def set_demand_weights(self, demand_weights):
+        """
+        Sets the relative likelihood of an emergency occurring on each edge.
+        The weights can be a dictionary mapping edge IDs to weights (missing edges get no weight) or an array aligned
+        with the edge IDs of the index.
+        """
+
+        if isinstance(demand_weights, dict):
+            weights = np.zeros(len(self))
+            for edge_id, weight in demand_weights.items():
+                if edge_id in self.edge_positions:
+                    weights[self.edge_positions[edge_id]] = weight
+        else:
+            weights = np.asarray(demand_weights, dtype=float)
+            if weights.shape != (len(self),):
+                raise ValueError(f"Expected {len(self)} demand weights but received an array of shape {weights.shape}.")
+
+        if np.any(weights < 0) or weights.sum() <= 0:
+            raise ValueError("Demand weights must be non-negative and contain at least one positive weight.")
+        self.probabilities = weights / weights.sum()
+
+    def sample_indices(self, num_emergencies, rng=None, weighted=True):
+        """Returns an array of the positions in the index of randomly drawn emergency edges."""
+
+        rng = get_random_generator(rng)
+        probabilities = self.probabilities if weighted else None
+
+        return rng.choice(len(self), size=num_emergencies, p=probabilities)
+
+    def sample(self, num_emergencies, rng=None, weighted=True):
+        """Returns arrays of the edge IDs, latitudes, and longitudes of randomly drawn emergencies."""
+
+        indices = self.sample_indices(num_emergencies, rng, weighted)
+
+        return self.edge_ids[indices], self.latitudes[indices], self.longitudes[indices]
+
+
+class EdgeSnapIndex:
+    """
+    This class finds the nearest edges that emergency vehicles can depart from for batches of coordinates.
+    The shapes of the edges are split into short segments whose midpoints are stored in a KD-tree over the projected
+    network coordinates, and the candidates returned by the tree are refined with exact point to segment distances.
+    It can be built from a parsed SUMO network or a CompactNetwork.
+    """
+
+    def __init__(self, net, max_segment_length=20.0, num_candidates=16):
+
+        self.net = net
+        self.num_candidates = num_candidates
+        self.edge_ids, shapes = get_emergency_edge_shapes(net)
+
+        # split the shape of each edge into segments no longer than the maximum segment length
+        starts, ends, segment_edges = [], [], []
+        for i, shape in enumerate(shapes):
+            for start, end in zip(shape[:-1], shape[1:]):
+                num_pieces = max(1, int(np.ceil(np.linalg.norm(end - start) / max_segment_length)))
+                fractions = np.linspace(0, 1, num_pieces + 1)[:, np.newaxis]
+                points = start + fractions * (end - start)
+                starts.append(points[:-1])
+                ends.append(points[1:])
+                segment_edges.append(np.full(num_pieces, i))
+        self.segment_starts = np.concatenate(starts)
+        self.segment_ends = np.concatenate(ends)
+        self.segment_edges = np.concatenate(segment_edges)
+        self.tree = cKDTree((self.segment_starts + self.segment_ends) / 2)
+
+    def query_xy(self, x, y):
+        """Returns arrays of the positions of the nearest edges to the XY coordinates and their distances."""
+
+        points = np.column_stack((np.atleast_1d(x), np.atleast_1d(y))).astype(float)
+        num_candidates = min(self.num_candidates, len(self.segment_edges))
+        _, candidates = self.tree.query(points, k=num_candidates)
+        candidates = candidates.reshape(len(points), num_candidates)
+
+        # find the exact distance from each point to each of its candidate segments
+        starts = self.segment_starts[candidates]
+        directions = self.segment_ends[candidates] - starts
+        offsets = points[:, np.newaxis, :] - starts
+        lengths = np.maximum(np.sum(directions ** 2, axis=2), 1e-12)
+        fractions = np.clip(np.sum(offsets * directions, axis=2) / lengths, 0, 1)
+        distances = np.linalg.norm(offsets - fractions[:, :, np.newaxis] * directions, axis=2)
+
+        # keep the closest candidate for each point
+        best = np.argmin(distances, axis=1)
+        rows = np.arange(len(points))
+
+        return self.segment_edges[candidates[rows, best]], distances[rows, best]
+
+    def query(self, coordinates):
+        """
+        Takes an (N, 2) array of coordinates where each row is (lat, lon).
+        Returns arrays of the IDs of the nearest edges and their distances (in meters).
+        """
+
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        x, y = convert_lat_lon_to_xy(self.net, coordinates[:, 0], coordinates[:, 1])
+        edge_positions, distances = self.query_xy(x, y)
+
+        return self.edge_ids[edge_positions], distances
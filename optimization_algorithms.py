@@ -6,25 +6,56 @@ Use goemetric optimization
 Use coverage optimization
 """
 
+import math
 import random
 
 import numpy as np
 
 
+def evaluate_loss(loss_function, placement_sets):
+    """
+    Returns a list of the loss of each set of station placements.
+    If the loss function provides evaluate_batch the sets are submitted together so they can be evaluated concurrently,
+    otherwise the loss function is called on each set in turn.
+    """
+
+    evaluate_batch = getattr(loss_function, 'evaluate_batch', None)
+    if evaluate_batch is not None:
+        return list(evaluate_batch(placement_sets))
+
+    return [loss_function(placements) for placements in placement_sets]
+
+
 class OptimizationAlgorithm:
-    """This is a template optimization object which the optimization algorithms inherit."""
+    """
+    This is a template optimization object which the optimization algorithms inherit.
+    Algorithms expose an ask/tell interface: ask returns a batch of candidate station placement sets and tell takes
+    their losses, so any batch evaluator (a worker pool, a cache, or a surrogate) can drive the algorithm.
+    update_placements runs one ask/tell step using the algorithm's own loss function.
+    If a screening loss function is passed, candidates are first ranked with it (it should be a cheap estimate such as
+    the travel time surrogate) and only the promising candidates are evaluated with the full loss function.
+    """
 
     def __init__(self,
                  loss_function,
                  num_stations,
                  station_bounds,
-                 seed=None):
+                 seed=None,
+                 screening_loss_function=None,
+                 promotion_proportion=0.2,
+                 promotion_tolerance=0.0):
 
         if seed:
             random.seed(seed)
         self.loss_function = loss_function
         self.num_stations = num_stations
         self.station_bounds = station_bounds
+        self.screening_loss_function = screening_loss_function
+        self.promotion_proportion = promotion_proportion
+        self.promotion_tolerance = promotion_tolerance
+        self.num_full_evaluations = 0
+        self.num_screening_evaluations = 0
+        self.num_evaluations_saved = 0
         self.fitness = 0
         self.station_placements = []
         self.initialize_placements()
@@ -32,9 +63,66 @@ class OptimizationAlgorithm:
     def initialize_placements(self):
         raise NotImplementedError("Implement this function in the optimization algorithm.")
 
-    def update_placements(self):
+    def ask(self):
+        raise NotImplementedError("Implement this function in the optimization algorithm.")
+
+    def tell(self, fitness_scores):
         raise NotImplementedError("Implement this function in the optimization algorithm.")
 
+    def update_placements(self):
+        """
+        Calling this function runs the next iteration of the optimization algorithm.
+        Returns the best fitness after the iteration.
+        """
+
+        return self.tell(self.evaluate_promising_placements(self.ask()))
+
+    def evaluate_placements(self, placement_sets):
+        """Returns a list of the loss of each set of station placements, counting the full evaluations."""
+
+        self.num_full_evaluations += len(placement_sets)
+
+        return evaluate_loss(self.loss_function, placement_sets)
+
+    def screen_placements(self, placement_sets):
+        """Returns a list of the screening loss of each set of station placements."""
+
+        self.num_screening_evaluations += len(placement_sets)
+
+        return evaluate_loss(self.screening_loss_function, placement_sets)
+
+    def evaluate_promising_placements(self, placement_sets):
+        """
+        Returns a list of the loss of each set of station placements.
+        Without a screening loss function every set is fully evaluated.
+        Otherwise only the best promotion_proportion of the sets (by screening loss) are fully evaluated and the
+        remaining sets are given an infinite loss.
+        """
+
+        if self.screening_loss_function is None:
+            return self.evaluate_placements(placement_sets)
+
+        # rank the sets by the screening loss and promote the best of them
+        screening_scores = self.screen_placements(placement_sets)
+        num_promoted = min(len(placement_sets), max(1, math.ceil(self.promotion_proportion * len(placement_sets))))
+        promoted_indices = np.argsort(screening_scores, kind='stable')[:num_promoted]
+        self.num_evaluations_saved += len(placement_sets) - num_promoted
+
+        # fully evaluate the promoted sets
+        scores = [math.inf] * len(placement_sets)
+        promoted_scores = self.evaluate_placements([placement_sets[i] for i in promoted_indices])
+        for i, score in zip(promoted_indices, promoted_scores):
+            scores[i] = score
+
+        return scores
+
+    def get_evaluation_report(self):
+        """Returns a dictionary counting the full and screening evaluations and the full evaluations saved."""
+
+        return {"Full Evaluations": self.num_full_evaluations,
+                "Screening Evaluations": self.num_screening_evaluations,
+                "Full Evaluations Saved": self.num_evaluations_saved}
+
     def get_random_station_location(self):
         """This function returns a random tuple of (lat, lon) within the bounds."""
 
@@ -43,6 +131,22 @@ class OptimizationAlgorithm:
 
         return latitude, longitude
 
+    def get_placement_sets(self, placements):
+        """Converts an array of shape (num_sets, num_stations, 2) to a list of lists of (lat, lon) tuples."""
+
+        return [[tuple(station) for station in pop] for pop in np.asarray(placements).tolist()]
+
+    def get_unnormalized_placements(self, normalized_placements):
+        """
+        Converts an array of shape (num_sets, num_stations * 2) with each coordinate scaled to [0, 1] within the
+        station bounds into an array of shape (num_sets, num_stations, 2) of (lat, lon) coordinates.
+        """
+
+        lower_bounds, upper_bounds = np.array(self.station_bounds[0]), np.array(self.station_bounds[1])
+        normalized_placements = np.clip(normalized_placements, 0, 1).reshape(-1, self.num_stations, 2)
+
+        return lower_bounds + normalized_placements * (upper_bounds - lower_bounds)
+
 
 class HillClimberOptimizationAlgorithm(OptimizationAlgorithm):
     """This class implements the hill climber optimization algorithm."""
@@ -53,11 +157,31 @@ class HillClimberOptimizationAlgorithm(OptimizationAlgorithm):
                  num_stations=3,
                  num_mutations=1,
                  max_shift_proportion=0.1,
-                 seed=None):
-
+                 seed=None,
+                 screening_loss_function=None,
+                 promotion_tolerance=0.0,
+                 racing=False,
+                 racing_confidence=0.95,
+                 racing_chunk_size=5,
+                 num_candidates=1):
+
+        if racing and not hasattr(loss_function, 'race'):
+            raise ValueError(f"Racing was requested but {type(loss_function).__name__} does not support racing.")
         self.num_mutations = num_mutations
         self.max_shift_proportion = max_shift_proportion
-        super().__init__(loss_function, num_stations, station_bounds, seed)
+        self.num_candidates = num_candidates
+        self.candidate_placements = []
+        self.screening_fitness = None
+        self.racing = racing
+        self.racing_confidence = racing_confidence
+        self.racing_chunk_size = racing_chunk_size
+        self.num_raced_simulations = 0
+        super().__init__(loss_function,
+                         num_stations,
+                         station_bounds,
+                         seed,
+                         screening_loss_function=screening_loss_function,
+                         promotion_tolerance=promotion_tolerance)
 
     def initialize_placements(self):
         """This function makes initial station placements and computes initial fitness."""
@@ -67,7 +191,9 @@ class HillClimberOptimizationAlgorithm(OptimizationAlgorithm):
             self.station_placements.append(self.get_random_station_location())
 
         # find the fitness
-        self.fitness = self.loss_function(self.station_placements)
+        self.fitness = self.evaluate_placements([self.station_placements])[0]
+        if self.screening_loss_function is not None:
+            self.screening_fitness = self.screen_placements([self.station_placements])[0]
 
     def get_mutated_placements(self):
         """Returns a list of station placements that are mutated from the current placements."""
@@ -88,26 +214,79 @@ class HillClimberOptimizationAlgorithm(OptimizationAlgorithm):
 
         return mutated_station_placements
 
+    def get_evaluation_report(self):
+        """Returns a dictionary counting the evaluations, including the simulations run when racing."""
+
+        report = super().get_evaluation_report()
+        if self.racing:
+            report["Raced Simulations"] = self.num_raced_simulations
+
+        return report
+
+    def ask(self):
+        """Returns a list of num_candidates mutations of the current station placements."""
+
+        self.candidate_placements = [self.get_mutated_placements() for _ in range(self.num_candidates)]
+
+        return self.candidate_placements
+
+    def tell(self, fitness_scores):
+        """Replaces the placements with the best candidate if it improves the fitness and returns the fitness."""
+
+        best_index = int(np.argmin(fitness_scores))
+        if self.fitness > fitness_scores[best_index]:
+            self.station_placements = self.candidate_placements[best_index]
+            self.fitness = fitness_scores[best_index]
+
+        return self.fitness
+
     def update_placements(self):
         """
         Calling this function runs the next iteration of the hill climber optimization algorithm.
         Returns the improvement in fitness over the previous iteration (if any).
         """
 
-        # find new station coordinates and evaluate their fitness
-        new_placements = self.get_mutated_placements()
-        new_fitness = self.loss_function(new_placements)
+        # find new station coordinates
+        candidates = self.ask()
+        fitness_scores = [math.inf] * len(candidates)
+        promoted_indices = list(range(len(candidates)))
+
+        # skip the full evaluation if the screening loss shows the new placements are unlikely to be an improvement
+        if self.screening_loss_function is not None:
+            screening_scores = self.screen_placements(candidates)
+            promoted_indices = [i for i, screening_score in enumerate(screening_scores)
+                                if screening_score <= self.screening_fitness * (1 + self.promotion_tolerance)]
+            self.num_evaluations_saved += len(candidates) - len(promoted_indices)
+
+        # evaluate the fitness of the new placements, stopping early if racing shows they are clearly worse
+        if self.racing:
+            for i in promoted_indices:
+                fitness_scores[i], num_simulations, _ = self.loss_function.race(candidates[i],
+                                                                                self.fitness,
+                                                                                confidence=self.racing_confidence,
+                                                                                chunk_size=self.racing_chunk_size)
+                self.num_full_evaluations += 1
+                self.num_raced_simulations += num_simulations
+        else:
+            promoted_scores = self.evaluate_placements([candidates[i] for i in promoted_indices])
+            for i, fitness_score in zip(promoted_indices, promoted_scores):
+                fitness_scores[i] = fitness_score
 
         # if fitness has improved, replace the current solution with the new one
-        if self.fitness > new_fitness:
-            self.station_placements = new_placements
-            self.fitness = new_fitness
+        previous_fitness = self.fitness
+        self.tell(fitness_scores)
+        if self.screening_loss_function is not None and self.fitness < previous_fitness:
+            self.screening_fitness = screening_scores[int(np.argmin(fitness_scores))]
 
         return self.fitness
 
 
 class EvolutionaryOptimizationAlgorithm(OptimizationAlgorithm):
-    """This class implements the genetic optimization algorithm."""
+    """
+    This class implements the genetic optimization algorithm.
+    The population is stored as an array of shape (pop_size, num_stations, 2) where each station is a (lat, lon) pair,
+    so mutation, crossover, and selection are vectorized.
+    """
 
     def __init__(self,
                  loss_function,
@@ -117,24 +296,33 @@ class EvolutionaryOptimizationAlgorithm(OptimizationAlgorithm):
                  survivor_proportion=2,
                  num_mutations=1,
                  max_shift_proportion=0.1,
-                 seed=None):
+                 seed=None,
+                 screening_loss_function=None,
+                 promotion_proportion=0.2):
 
         self.pop_size = pop_size
         self.survivor_proportion = survivor_proportion
         self.num_mutations = num_mutations
         self.max_shift_proportion = max_shift_proportion
-        self.fitness_scores = []
-        super().__init__(loss_function, num_stations, station_bounds, seed)
+        self.fitness_scores = np.array([])
+        self.candidate_placements = None
+        self.rng = None
+        super().__init__(loss_function,
+                         num_stations,
+                         station_bounds,
+                         seed,
+                         screening_loss_function=screening_loss_function,
+                         promotion_proportion=promotion_proportion)
 
     def initialize_placements(self):
         """This function makes initial station placements and computes initial fitness."""
 
+        # the generator is seeded from the random module so that the seed keeps runs reproducible
+        self.rng = np.random.default_rng(random.getrandbits(32))
+
         # place the stations randomly
-        for _ in range(self.pop_size):
-            pop = []
-            for _ in range(self.num_stations):
-                pop.append(self.get_random_station_location())
-            self.station_placements.append(pop)
+        lower_bounds, upper_bounds = np.array(self.station_bounds[0]), np.array(self.station_bounds[1])
+        self.station_placements = self.rng.uniform(lower_bounds, upper_bounds, (self.pop_size, self.num_stations, 2))
 
         # find the fitness
         self.fitness_scores, self.fitness = self.get_fitness_scores(self.station_placements)
@@ -142,66 +330,371 @@ class EvolutionaryOptimizationAlgorithm(OptimizationAlgorithm):
     def get_fitness_scores(self, placements):
         """This function returns the fitness of each member of the population and best (lowest) fitness."""
 
-        fitness_scores = []
-        for pop in placements:
-            fitness_scores.append(self.loss_function(pop))
+        fitness_scores = np.array(self.evaluate_promising_placements(self.get_placement_sets(placements)), dtype=float)
 
-        return fitness_scores, min(fitness_scores)
+        return fitness_scores, fitness_scores.min()
 
     def get_mutated_placements(self):
-        """Returns a list of station placements that are mutated from the current placements."""
+        """Returns an array of station placements that are mutated from the current placements."""
 
         # determine how far each station can move
-        max_lat_shift = (self.station_bounds[1][0] - self.station_bounds[0][0]) * self.max_shift_proportion
-        max_lon_shift = (self.station_bounds[1][1] - self.station_bounds[0][1]) * self.max_shift_proportion
+        lower_bounds, upper_bounds = np.array(self.station_bounds[0]), np.array(self.station_bounds[1])
+        max_shifts = (upper_bounds - lower_bounds) * self.max_shift_proportion
 
-        # mutate the list of station placements
-        mutated_station_placements = [pop[:] for pop in self.station_placements]
-        for p in range(self.pop_size):
-            for _ in range(self.num_mutations):
-                index = random.randint(0, self.num_stations-1)
-                placement = self.station_placements[p][index]
-                lat_shift = random.uniform(-max_lat_shift, max_lat_shift)
-                lon_shift = random.uniform(-max_lon_shift, max_lon_shift)
-                new_placement = (placement[0] + lat_shift, placement[1] + lon_shift)
-                mutated_station_placements[p][index] = new_placement
+        # shift randomly chosen stations of each member of the population and keep them within the bounds
+        pop_size = len(self.station_placements)
+        members = np.repeat(np.arange(pop_size), self.num_mutations)
+        stations = self.rng.integers(0, self.num_stations, pop_size * self.num_mutations)
+        shifts = self.rng.uniform(-max_shifts, max_shifts, (pop_size * self.num_mutations, 2))
+        mutated_station_placements = self.station_placements.copy()
+        np.add.at(mutated_station_placements, (members, stations), shifts)
 
-        return mutated_station_placements
+        return np.clip(mutated_station_placements, lower_bounds, upper_bounds)
 
     def get_survivors(self):
-        """Returns a new population with only the survivors with the best fitness scores."""
+        """Returns a new population with only the survivors with the best fitness scores, ordered best first."""
 
-        surviving_station_placements = []
-        num_survivors = int(self.survivor_proportion * self.pop_size)
-        for _ in range(num_survivors):
-            best_index = self.fitness_scores.index(min(self.fitness_scores))
-            surviving_station_placements.append(self.station_placements[best_index])
-            self.fitness_scores[best_index] = 99999
+        num_survivors = min(int(self.survivor_proportion * self.pop_size), len(self.fitness_scores))
+        survivors = np.argpartition(self.fitness_scores, num_survivors - 1)[:num_survivors]
+        survivors = survivors[np.argsort(self.fitness_scores[survivors], kind='stable')]
 
-        return surviving_station_placements
+        return self.station_placements[survivors]
 
     def crossover(self):
         """This function fills any missing population with crossover and returns the result."""
 
-        crossover_station_placements = [pop[:] for pop in self.station_placements]
-        while len(crossover_station_placements) < self.pop_size:
-            new_pop = []
-            for _ in range(self.num_stations):
-                new_pop.append(random.choice(random.choice(self.station_placements)))
-            crossover_station_placements.append(new_pop)
+        num_missing = self.pop_size - len(self.station_placements)
+        if num_missing <= 0:
+            return self.station_placements
 
-        return crossover_station_placements
+        # build each new member from stations of randomly chosen survivors
+        parents = self.rng.integers(0, len(self.station_placements), (num_missing, self.num_stations))
+        stations = self.rng.integers(0, self.num_stations, (num_missing, self.num_stations))
+        children = self.station_placements[parents, stations]
 
-    def update_placements(self):
+        return np.concatenate((self.station_placements, children))
+
+    def ask(self):
+        """Returns the mutated population as a list of sets of station placements."""
+
+        self.candidate_placements = self.get_mutated_placements()
+
+        return self.get_placement_sets(self.candidate_placements)
+
+    def tell(self, fitness_scores):
         """
-        Calling this function runs the next iteration of the evolutionary algorithm.
-        Returns the best fitness achieved in this generation.
+        Keeps the survivors of the mutated population, refills the population with crossover, and returns the best
+        fitness achieved in this generation.
         """
 
-        # find new station coordinates and evaluate their fitness
-        new_placements = self.get_mutated_placements()
-        self.fitness_scores, self.fitness = self.get_fitness_scores(new_placements)
+        self.station_placements = self.candidate_placements
+        self.fitness_scores = np.array(fitness_scores, dtype=float)
+        self.fitness = self.fitness_scores.min()
         self.station_placements = self.get_survivors()
         self.station_placements = self.crossover()
 
         return self.fitness
+
+
+class CMAESOptimizationAlgorithm(OptimizationAlgorithm):
+    """
+    This class implements the covariance matrix adaptation evolution strategy (CMA-ES).
+    The search runs over the station coordinates scaled to [0, 1] within the station bounds and candidates outside of
+    the bounds are moved onto them before they are evaluated.
+    The fitness and station placements are those of the best candidate found so far.
+    """
+
+    def __init__(self,
+                 loss_function,
+                 station_bounds,
+                 num_stations=3,
+                 pop_size=None,
+                 initial_step_size=0.3,
+                 seed=None,
+                 screening_loss_function=None,
+                 promotion_proportion=0.2):
+
+        # set the strategy parameters to their usual defaults for the number of dimensions
+        self.num_dimensions = 2 * num_stations
+        n = self.num_dimensions
+        self.pop_size = pop_size or 4 + int(3 * np.log(n))
+        self.num_parents = self.pop_size // 2
+        weights = np.log(self.num_parents + 0.5) - np.log(np.arange(1, self.num_parents + 1))
+        self.weights = weights / weights.sum()
+        self.mu_eff = 1 / np.sum(self.weights ** 2)
+        self.c_c = (4 + self.mu_eff / n) / (n + 4 + 2 * self.mu_eff / n)
+        self.c_sigma = (self.mu_eff + 2) / (n + self.mu_eff + 5)
+        self.c_1 = 2 / ((n + 1.3) ** 2 + self.mu_eff)
+        self.c_mu = min(1 - self.c_1, 2 * (self.mu_eff - 2 + 1 / self.mu_eff) / ((n + 2) ** 2 + self.mu_eff))
+        self.damping = 1 + 2 * max(0, np.sqrt((self.mu_eff - 1) / (n + 1)) - 1) + self.c_sigma
+        self.expected_norm = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        # initialize the state of the distribution
+        self.step_size = initial_step_size
+        self.covariance = np.eye(n)
+        self.covariance_path = np.zeros(n)
+        self.step_size_path = np.zeros(n)
+        self.generation = 0
+        self.mean = None
+        self.candidate_steps = None
+        self.candidate_placements = None
+        self.rng = None
+        super().__init__(loss_function,
+                         num_stations,
+                         station_bounds,
+                         seed,
+                         screening_loss_function=screening_loss_function,
+                         promotion_proportion=promotion_proportion)
+
+    def initialize_placements(self):
+        """This function places the mean of the search distribution randomly and computes its fitness."""
+
+        self.rng = np.random.default_rng(random.getrandbits(32))
+        self.mean = self.rng.uniform(0, 1, self.num_dimensions)
+        self.station_placements = self.get_placement_sets(self.get_unnormalized_placements(self.mean))[0]
+        self.fitness = self.evaluate_placements([self.station_placements])[0]
+
+    def ask(self):
+        """Returns a list of station placement sets sampled from the search distribution."""
+
+        eigenvalues, eigenvectors = np.linalg.eigh(self.covariance)
+        scales = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        normal_samples = self.rng.standard_normal((self.pop_size, self.num_dimensions))
+        self.candidate_steps = (normal_samples * scales) @ eigenvectors.T
+        self.candidate_placements = self.get_unnormalized_placements(self.mean + self.step_size * self.candidate_steps)
+
+        return self.get_placement_sets(self.candidate_placements)
+
+    def tell(self, fitness_scores):
+        """Updates the search distribution from the fitness of the candidates and returns the best fitness so far."""
+
+        n = self.num_dimensions
+        fitness_scores = np.asarray(fitness_scores, dtype=float)
+        order = np.argsort(fitness_scores, kind='stable')
+
+        # remember the best candidate found so far
+        if fitness_scores[order[0]] < self.fitness:
+            self.fitness = fitness_scores[order[0]]
+            self.station_placements = self.get_placement_sets(self.candidate_placements[order[:1]])[0]
+
+        # move the mean towards the best candidates
+        weighted_step = self.weights @ self.candidate_steps[order[:self.num_parents]]
+        self.mean = np.clip(self.mean + self.step_size * weighted_step, 0, 1)
+
+        # update the evolution paths
+        eigenvalues, eigenvectors = np.linalg.eigh(self.covariance)
+        inverse_sqrt_covariance = eigenvectors @ np.diag(1 / np.sqrt(np.maximum(eigenvalues, 1e-20))) @ eigenvectors.T
+        self.step_size_path = ((1 - self.c_sigma) * self.step_size_path
+                               + np.sqrt(self.c_sigma * (2 - self.c_sigma) * self.mu_eff)
+                               * inverse_sqrt_covariance @ weighted_step)
+        self.generation += 1
+        path_norm = np.linalg.norm(self.step_size_path) / np.sqrt(1 - (1 - self.c_sigma) ** (2 * self.generation))
+        h_sigma = float(path_norm / self.expected_norm < 1.4 + 2 / (n + 1))
+        self.covariance_path = ((1 - self.c_c) * self.covariance_path
+                                + h_sigma * np.sqrt(self.c_c * (2 - self.c_c) * self.mu_eff) * weighted_step)
+
+        # adapt the covariance matrix and the step size
+        parent_steps = self.candidate_steps[order[:self.num_parents]]
+        rank_one = np.outer(self.covariance_path, self.covariance_path)
+        rank_mu = (parent_steps * self.weights[:, np.newaxis]).T @ parent_steps
+        self.covariance = ((1 - self.c_1 - self.c_mu) * self.covariance
+                           + self.c_1 * (rank_one + (1 - h_sigma) * self.c_c * (2 - self.c_c) * self.covariance)
+                           + self.c_mu * rank_mu)
+        self.covariance = (self.covariance + self.covariance.T) / 2
+        self.step_size *= np.exp((self.c_sigma / self.damping)
+                                 * (np.linalg.norm(self.step_size_path) / self.expected_norm - 1))
+
+        return self.fitness
+
+
+class ParticleSwarmOptimizationAlgorithm(OptimizationAlgorithm):
+    """
+    This class implements particle swarm optimization.
+    The particles move over the station coordinates scaled to [0, 1] within the station bounds.
+    The fitness and station placements are those of the best position found by the swarm so far.
+    """
+
+    def __init__(self,
+                 loss_function,
+                 station_bounds,
+                 num_stations=3,
+                 pop_size=20,
+                 inertia=0.7298,
+                 cognitive_weight=1.49618,
+                 social_weight=1.49618,
+                 max_velocity=0.2,
+                 seed=None,
+                 screening_loss_function=None,
+                 promotion_proportion=0.2):
+
+        self.pop_size = pop_size
+        self.inertia = inertia
+        self.cognitive_weight = cognitive_weight
+        self.social_weight = social_weight
+        self.max_velocity = max_velocity
+        self.positions = None
+        self.velocities = None
+        self.best_positions = None
+        self.best_fitness_scores = None
+        self.rng = None
+        super().__init__(loss_function,
+                         num_stations,
+                         station_bounds,
+                         seed,
+                         screening_loss_function=screening_loss_function,
+                         promotion_proportion=promotion_proportion)
+
+    def initialize_placements(self):
+        """This function places the particles randomly and computes their fitness."""
+
+        self.rng = np.random.default_rng(random.getrandbits(32))
+        num_dimensions = 2 * self.num_stations
+        self.positions = self.rng.uniform(0, 1, (self.pop_size, num_dimensions))
+        self.velocities = self.rng.uniform(-self.max_velocity, self.max_velocity, (self.pop_size, num_dimensions))
+        self.best_positions = self.positions.copy()
+        self.best_fitness_scores = np.full(self.pop_size, np.inf)
+        self.fitness = np.inf
+        self.tell(self.evaluate_promising_placements(self.ask()))
+
+    def ask(self):
+        """Returns the current position of each particle as a list of station placement sets."""
+
+        return self.get_placement_sets(self.get_unnormalized_placements(self.positions))
+
+    def tell(self, fitness_scores):
+        """Updates the best positions, moves the particles, and returns the best fitness found so far."""
+
+        # update the best position of each particle and of the swarm
+        fitness_scores = np.asarray(fitness_scores, dtype=float)
+        improved = fitness_scores < self.best_fitness_scores
+        self.best_positions[improved] = self.positions[improved]
+        self.best_fitness_scores[improved] = fitness_scores[improved]
+        best_index = int(np.argmin(self.best_fitness_scores))
+        if self.best_fitness_scores[best_index] < self.fitness:
+            self.fitness = self.best_fitness_scores[best_index]
+            self.station_placements = self.get_placement_sets(
+                self.get_unnormalized_placements(self.best_positions[best_index]))[0]
+
+        # move the particles towards their own best positions and the best position of the swarm
+        cognitive_random = self.rng.uniform(0, 1, self.positions.shape)
+        social_random = self.rng.uniform(0, 1, self.positions.shape)
+        self.velocities = (self.inertia * self.velocities
+                           + self.cognitive_weight * cognitive_random * (self.best_positions - self.positions)
+                           + self.social_weight * social_random * (self.best_positions[best_index] - self.positions))
+        self.velocities = np.clip(self.velocities, -self.max_velocity, self.max_velocity)
+        self.positions = np.clip(self.positions + self.velocities, 0, 1)
+
+        return self.fitness
+
+
+class DiscreteLocationOptimizationAlgorithm(OptimizationAlgorithm):
+    """
+    This class chooses station placements from a discrete set of candidate sites.
+    It uses a precomputed matrix of the travel time from each candidate site to each demand point and solves either
+    the p-median problem (minimizing the mean response time) or the p-center problem (minimizing the maximum response
+    time) with greedy construction followed by Teitz-Bart interchange.
+    Each call to update_placements makes the single site swap that most improves the objective.
+    """
+
+    def __init__(self,
+                 candidate_sites,
+                 travel_time_matrix,
+                 num_stations=3,
+                 objective="median",
+                 demand_weights=None,
+                 loss_function=None,
+                 station_bounds=None,
+                 seed=None):
+
+        if objective not in ("median", "center"):
+            raise ValueError(f"Unknown objective {objective}, expected 'median' or 'center'.")
+        self.candidate_sites = list(candidate_sites)
+        self.travel_time_matrix = np.asarray(travel_time_matrix, dtype=float)
+        if self.travel_time_matrix.shape[0] != len(self.candidate_sites):
+            raise ValueError("The travel time matrix must have one row for each candidate site.")
+        if num_stations > len(self.candidate_sites):
+            raise ValueError("There must be at least as many candidate sites as stations.")
+        self.objective = objective
+        if demand_weights is None:
+            demand_weights = np.ones(self.travel_time_matrix.shape[1])
+        self.demand_weights = np.asarray(demand_weights, dtype=float) / np.sum(demand_weights)
+        self.selected_sites = []
+        self.converged = False
+        super().__init__(loss_function, num_stations, station_bounds, seed)
+
+    def get_objective_values(self, travel_times, tie_break=False):
+        """
+        Returns the objective of each row of an array of the travel times to each demand point.
+        The maximum travel time rarely changes with a single swap, so if tie_break is True a tiny multiple of the mean
+        travel time is added to the p-center objective to rank swaps which tie on the maximum.
+        """
+
+        mean_travel_times = travel_times @ self.demand_weights
+        if self.objective == "median":
+            return mean_travel_times
+
+        max_travel_times = np.max(travel_times, axis=-1)
+        if tie_break:
+            return max_travel_times + 1e-6 * mean_travel_times
+
+        return max_travel_times
+
+    def initialize_placements(self):
+        """This function greedily adds the station which most improves the objective until all are placed."""
+
+        nearest_travel_times = np.full(self.travel_time_matrix.shape[1], np.inf)
+        available = np.ones(len(self.candidate_sites), dtype=bool)
+        for _ in range(self.num_stations):
+            objective_values = self.get_objective_values(np.minimum(nearest_travel_times, self.travel_time_matrix),
+                                                         tie_break=True)
+            objective_values[~available] = np.inf
+            site = int(np.argmin(objective_values))
+            self.selected_sites.append(site)
+            available[site] = False
+            nearest_travel_times = np.minimum(nearest_travel_times, self.travel_time_matrix[site])
+
+        self.station_placements = [self.candidate_sites[site] for site in self.selected_sites]
+        self.fitness = self.get_objective_values(nearest_travel_times)
+
+    def update_placements(self):
+        """
+        Calling this function runs the next interchange step, swapping the selected site and candidate site which most
+        improve the objective.
+        Returns the fitness after the swap (which is unchanged once no swap improves it).
+        """
+
+        if self.converged:
+            return self.fitness
+
+        # find the nearest and second nearest selected site to each demand point
+        selected_travel_times = self.travel_time_matrix[self.selected_sites]
+        order = np.argsort(selected_travel_times, axis=0)
+        nearest = np.take_along_axis(selected_travel_times, order[:1], axis=0)[0]
+        if len(self.selected_sites) > 1:
+            second_nearest = np.take_along_axis(selected_travel_times, order[1:2], axis=0)[0]
+        else:
+            second_nearest = np.full_like(nearest, np.inf)
+
+        # evaluate replacing each selected site with each candidate site
+        available = np.ones(len(self.candidate_sites), dtype=bool)
+        available[self.selected_sites] = False
+        best_swap, best_value = None, self.get_objective_values(nearest, tie_break=True)
+        for position in range(len(self.selected_sites)):
+            without_site = np.where(order[0] == position, second_nearest, nearest)
+            objective_values = self.get_objective_values(np.minimum(without_site, self.travel_time_matrix),
+                                                         tie_break=True)
+            objective_values[~available] = np.inf
+            site = int(np.argmin(objective_values))
+            if objective_values[site] < best_value:
+                best_swap, best_value = (position, site), objective_values[site]
+
+        # make the best swap, or stop if no swap improves the objective
+        if best_swap is None:
+            self.converged = True
+        else:
+            position, site = best_swap
+            self.selected_sites[position] = site
+            self.station_placements = [self.candidate_sites[site] for site in self.selected_sites]
+            self.fitness = self.get_objective_values(np.min(self.travel_time_matrix[self.selected_sites], axis=0))
+
+        return self.fitness
@@ -1,12 +1,31 @@
 """This file contains code for optimizing the placement of fire stations."""
 
+import json
+import random
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 import matplotlib.pyplot as plt
 
-from optimization_algorithms import HillClimberOptimizationAlgorithm, EvolutionaryOptimizationAlgorithm
+from optimization_algorithms import HillClimberOptimizationAlgorithm, EvolutionaryOptimizationAlgorithm, \
+    DiscreteLocationOptimizationAlgorithm, CMAESOptimizationAlgorithm, ParticleSwarmOptimizationAlgorithm
+from travel_time_surrogate import TravelTimeSurrogate
 from sumo_interface import get_network_coordinate_bounds, get_network_file_path
-from file_paths import get_simulation_data_file_path, get_output_file_path, create_output_directory
-from loss_functions import get_mean_response_loss, \
-    get_median_response_loss, get_max_95_percentile_response_loss, get_max_loss
+from file_paths import get_simulation_data_file_path, get_output_file_path, create_output_directory, \
+    get_cache_file_path, create_cache_directory
+from loss_functions import get_shared_sample_losses, get_surrogate_losses, MemoizedLoss, RESPONSE_TIME_STATISTICS
+from scenario_bank import get_scenario_bank
+from results_store import ResultsStore, RecordingLoss, get_fitness_histories
+from profiling import profile_scope
+
+
+ALGORITHM_CLASSES = {algorithm_class.__name__: algorithm_class
+                     for algorithm_class in (HillClimberOptimizationAlgorithm,
+                                             EvolutionaryOptimizationAlgorithm,
+                                             CMAESOptimizationAlgorithm,
+                                             ParticleSwarmOptimizationAlgorithm)}
+_experiment_losses = {}  # maps an experiment loss configuration to a dictionary of its loss functions
 
 
 def construct_fitness_plot(fitness_values, parameters, loss_function_names, title="Fitness Plot"):
@@ -28,16 +47,167 @@ def construct_fitness_plot(fitness_values, parameters, loss_function_names, titl
     plt.savefig(get_output_file_path(f"{title}.png"))
 
 
-def run_algorithm(algorithm, num_generations=10):
-    """Runs the passed optimization algorithm and returns its fitness scores."""
+def run_algorithm(algorithm, num_generations=10, recorder=None):
+    """
+    Runs the passed optimization algorithm and returns its fitness scores.
+    If a RecordingLoss is passed, its generation is kept up to date so evaluations are recorded against the generation
+    that made them.
+    """
 
     fitness_values = [algorithm.fitness]
-    for _ in range(num_generations):
-        fitness_values.append(algorithm.update_placements())
+    for generation in range(1, num_generations + 1):
+        if recorder is not None:
+            recorder.generation = generation
+        with profile_scope("generation"):
+            fitness_values.append(algorithm.update_placements())
 
     return fitness_values
 
 
+def get_experiment_losses(sim_name,
+                          num_simulations,
+                          seed,
+                          memoize=False,
+                          use_surrogate=False,
+                          persist=True,
+                          common_random_numbers=False,
+                          delta_evaluation=False):
+    """
+    Returns a dictionary mapping the name of each loss function to the loss function used in experiments.
+    The loss functions are built once per process and configuration so experiments run in the same process share them.
+    If common_random_numbers is True, every placement is simulated on the scenarios of a bank generated with the seed
+    (which holds enough scenarios for racing to double the number of simulations).
+    If delta_evaluation is True as well, only the emergencies whose dispatching station changed are simulated again.
+    Memoized losses are only persisted when they are deterministic (estimated by the surrogate or simulated on a
+    scenario bank).
+    """
+
+    key = (sim_name, num_simulations, seed, memoize, use_surrogate, persist, common_random_numbers, delta_evaluation)
+    if key not in _experiment_losses:
+        directory = get_simulation_data_file_path(sim_name)
+        if use_surrogate:
+            losses = get_surrogate_losses(directory)
+        else:
+            scenarios = get_scenario_bank(directory, 2 * num_simulations, seed) if common_random_numbers else None
+            losses = get_shared_sample_losses(directory,
+                                              num_simulations,
+                                              scenarios=scenarios,
+                                              delta_evaluation=delta_evaluation and common_random_numbers)
+        if memoize:
+            # each seed has its own file since the losses of every seed are open at the same time
+            create_cache_directory()
+            losses = OrderedDict((name, MemoizedLoss(loss_function,
+                                                     cache_file_path=get_cache_file_path(f"{sim_name} {name} {seed}")
+                                                     if persist and loss_function.deterministic else None,
+                                                     seed=seed))
+                                 for name, loss_function in losses.items())
+        _experiment_losses[key] = losses
+
+    return _experiment_losses[key]
+
+
+def close_experiment_losses():
+    """Closes the persistent stores of any memoized experiment loss functions."""
+
+    for losses in _experiment_losses.values():
+        for loss_function in losses.values():
+            if isinstance(loss_function, MemoizedLoss):
+                loss_function.close()
+    _experiment_losses.clear()
+
+
+def run_experiment_job(job):
+    """
+    Runs the optimization algorithm for a single cell of an experiment grid and returns the job with its results.
+    This function runs in the worker processes of the experiment scheduler.
+    """
+
+    config = job["config"]
+    directory = get_simulation_data_file_path(config["sim_name"])
+
+    # jobs on a pool build their own losses so their results do not depend on the jobs run before them in the worker
+    if not job["share_losses"]:
+        close_experiment_losses()
+    station_bounds = get_network_coordinate_bounds(get_network_file_path(directory))
+    losses = get_experiment_losses(config["sim_name"],
+                                   config["num_simulations"],
+                                   job["seed"],
+                                   config["memoize"],
+                                   config["use_surrogate"],
+                                   job["persist"],
+                                   config["common_random_numbers"],
+                                   config["delta_evaluation"])
+
+    arg_dict = {config["parameter_name"]: job["parameter_value"]}
+    if config["multi_fidelity"]:
+        arg_dict["screening_loss_function"] = get_experiment_losses(config["sim_name"],
+                                                                    config["num_simulations"],
+                                                                    job["seed"],
+                                                                    use_surrogate=True)[job["loss_name"]]
+
+    # record every evaluation of the job in the results store
+    store = ResultsStore(job["results_directory"])
+    experiment = get_experiment_name(config)
+    recorder = RecordingLoss(losses[job["loss_name"]],
+                             store,
+                             experiment,
+                             job["loss_name"],
+                             job["parameter_value"],
+                             job["seed"])
+
+    # seed the random module directly so the random draws do not depend on which process runs the job
+    random.seed(job["seed"])
+    algorithm = ALGORITHM_CLASSES[config["algorithm"]](loss_function=recorder,
+                                                       station_bounds=station_bounds,
+                                                       num_stations=config["num_stations"],
+                                                       seed=job["seed"],
+                                                       **arg_dict)
+    job["fitness"] = [float(fitness) for fitness in run_algorithm(algorithm, config["num_generations"], recorder)]
+    job["report"] = algorithm.get_evaluation_report()
+
+    # the fitness history is written last so a job only counts as finished once all of its evaluations are stored
+    store.flush()
+    store.append_fitness_history(experiment,
+                                 job["loss_name"],
+                                 job["parameter_value"],
+                                 job["seed"],
+                                 job["fitness"],
+                                 job["report"])
+
+    return job
+
+
+def get_experiment_name(config):
+    """Returns the name identifying an experiment configuration in the results store."""
+
+    return json.dumps(config, sort_keys=True)
+
+
+def get_experiment_jobs(config,
+                        parameter_values,
+                        loss_function_names,
+                        seeds,
+                        results_directory,
+                        persist=True,
+                        share_losses=True):
+    """
+    Expands the experiment grid into a list of independent jobs, one for each loss, parameter value, and seed.
+    If share_losses is True, jobs run in the same process share their loss functions (and the caches of simulated and
+    memoized losses), so a job's losses may reuse the evaluations of earlier jobs.
+    """
+
+    return [{"config": config,
+             "loss_name": loss_name,
+             "parameter_value": parameter_value,
+             "seed": seed,
+             "results_directory": results_directory,
+             "persist": persist,
+             "share_losses": share_losses}
+            for loss_name in loss_function_names
+            for parameter_value in parameter_values
+            for seed in seeds]
+
+
 def run_algorithm_experiments(algorithm_class,
                               experimental_parameter_name,
                               experimental_parameter_values,
@@ -45,36 +215,119 @@ def run_algorithm_experiments(algorithm_class,
                               num_simulations=5,
                               num_stations=3,
                               num_generations=10,
-                              sim_name='test_sim'):
-    """Runs a series of experiments on the algorithm with each of the parameters and plots the results."""
+                              sim_name='test_sim',
+                              memoize=False,
+                              use_surrogate=False,
+                              multi_fidelity=False,
+                              num_seeds=1,
+                              num_workers=1,
+                              common_random_numbers=True,
+                              delta_evaluation=False):
+    """
+    Runs a series of experiments on the algorithm with each of the parameters and plots the results.
+    Each loss, parameter value, and seed is an independent job; with more than one worker the jobs run in parallel.
+    Every evaluation, fitness history, and evaluation report is saved in a results store as the jobs complete,
+    finished jobs are skipped when the experiments are run again, and the plot is rebuilt from the store.
+    The plot shows the mean fitness over the seeds.
+    If memoize is True, the loss of each station placement is cached and reused by later experiments (the cache is only
+    kept on disk when running with a single worker and the losses are deterministic).
+    With a single worker the jobs share their loss functions and caches, so a job can reuse the evaluations of earlier
+    jobs; with more workers each job builds its own loss functions so its results do not depend on the scheduling.
+    If use_surrogate is True, response times are estimated from the road network graph instead of simulated in SUMO.
+    If multi_fidelity is True, candidates are screened with the road network graph estimate before being simulated.
+    If common_random_numbers is True, every placement in a run is simulated on the same bank of emergency scenarios.
+    If delta_evaluation is True as well, the response time to each scenario from each station edge is reused, so moving
+    a single station only simulates the emergencies whose dispatching station changed.
+    """
 
-    directory = get_simulation_data_file_path(sim_name)
-    station_bounds = get_network_coordinate_bounds(get_network_file_path(directory))
-    loss_functions = [get_mean_response_loss(directory, num_simulations),
-                      get_median_response_loss(directory, num_simulations),
-                      get_max_95_percentile_response_loss(directory, num_simulations),
-                      get_max_loss(directory, num_simulations)]
-    loss_function_names = ["Mean Response Time",
-                           "Median Response Time",
-                           "Max 95th Percentile Response Time",
-                           "Max Response Time"]
-
-    all_fitness_values = []  # a list of lists of each fitness from each loss function
-    for loss_function in loss_functions:
-        loss_fitness_values = []  # a list of fitness scores from the particular loss function
-        for parameter_value in experimental_parameter_values:
-            arg_dict = {experimental_parameter_name: parameter_value}
-            algorithm = algorithm_class(loss_function=loss_function,
-                                        station_bounds=station_bounds,
-                                        num_stations=num_stations,
-                                        seed=0,
-                                        **arg_dict)
-            loss_fitness_values.append(run_algorithm(algorithm, num_generations))
-        all_fitness_values.append(loss_fitness_values)
+    config = {"algorithm": algorithm_class.__name__,
+              "parameter_name": experimental_parameter_name,
+              "num_simulations": num_simulations,
+              "num_stations": num_stations,
+              "num_generations": num_generations,
+              "sim_name": sim_name,
+              "memoize": memoize,
+              "use_surrogate": use_surrogate,
+              "multi_fidelity": multi_fidelity,
+              "common_random_numbers": common_random_numbers,
+              "delta_evaluation": delta_evaluation}
+    loss_function_names = list(RESPONSE_TIME_STATISTICS.keys())
+    seeds = list(range(num_seeds))
 
+    # find the jobs which have not been completed by an earlier run
+    create_cache_directory()
+    results_directory = get_cache_file_path(f"{algorithm_name} results")
+    results = get_fitness_histories(ResultsStore(results_directory), get_experiment_name(config))
+    jobs = [job for job in get_experiment_jobs(config,
+                                               experimental_parameter_values,
+                                               loss_function_names,
+                                               seeds,
+                                               results_directory,
+                                               persist=num_workers == 1,
+                                               share_losses=num_workers == 1)
+            if (job["loss_name"], job["parameter_value"], job["seed"]) not in results]
+
+    # generate the scenario banks before the jobs start so the workers only load them
+    if common_random_numbers and not use_surrogate and jobs:
+        for seed in seeds:
+            get_scenario_bank(get_simulation_data_file_path(sim_name), 2 * num_simulations, seed)
+
+    # run the jobs, which save their own results to the store as they finish
+    def record_job(job):
+        results[(job["loss_name"], job["parameter_value"], job["seed"])] = job["fitness"]
+
+    if num_workers == 1:
+        try:
+            for job in jobs:
+                record_job(run_experiment_job(job))
+        finally:
+            close_experiment_losses()
+    else:
+        with ProcessPoolExecutor(num_workers) as executor:
+            for future in as_completed([executor.submit(run_experiment_job, job) for job in jobs]):
+                record_job(future.result())
+
+    # average the fitness over the seeds of each cell and plot the results
+    all_fitness_values = [[np.mean([results[(loss_name, parameter_value, seed)] for seed in seeds], axis=0)
+                           for parameter_value in experimental_parameter_values]
+                          for loss_name in loss_function_names]
     construct_fitness_plot(all_fitness_values, experimental_parameter_values, loss_function_names, algorithm_name)
 
 
+def optimize_discrete_locations(sim_name='test_sim',
+                                num_stations=3,
+                                objective="median",
+                                candidate_sites=None,
+                                num_emergencies=2000,
+                                max_candidate_sites=500,
+                                max_generations=1000,
+                                seed=0):
+    """
+    Chooses station placements from candidate sites with the p-median or p-center solver and returns the converged
+    algorithm.
+    The demand points are a fixed sample of num_emergencies emergencies (every emergency edge if it is None).
+    If no candidate sites are passed, the network nodes are clustered into at most max_candidate_sites sites (every
+    node if it is None), since the solver holds the response time from every site to every demand point.
+    """
+
+    surrogate = TravelTimeSurrogate(get_simulation_data_file_path(sim_name),
+                                    num_emergencies,
+                                    rng=np.random.default_rng(seed))
+    if candidate_sites is None:
+        candidate_sites = surrogate.get_candidate_sites(max_candidate_sites, np.random.default_rng(seed))
+    algorithm = DiscreteLocationOptimizationAlgorithm(candidate_sites,
+                                                      surrogate.get_site_response_time_matrix(candidate_sites),
+                                                      num_stations=num_stations,
+                                                      objective=objective,
+                                                      seed=seed)
+    for _ in range(max_generations):
+        if algorithm.converged:
+            break
+        algorithm.update_placements()
+
+    return algorithm
+
+
 def run_all_experiments():
 
     # experiment with different mutation rates for the hill climber algorithm
@@ -85,7 +338,9 @@ def run_all_experiments():
                               values,
                               "Hill Climber Optimization",
                               num_stations=6,
-                              sim_name='staten_island_east')
+                              sim_name='staten_island_east',
+                              memoize=True,
+                              delta_evaluation=True)
 
     # experiment with different mutation rates for the hill climber algorithm
     algorithm_type = EvolutionaryOptimizationAlgorithm
@@ -95,7 +350,8 @@ def run_all_experiments():
                               values,
                               "Evolutionary Algorithm Optimization",
                               num_stations=6,
-                              sim_name='staten_island_east')
+                              sim_name='staten_island_east',
+                              memoize=True)
 
 
 if __name__ == "__main__":
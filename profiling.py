@@ -0,0 +1,212 @@
+"""
+This file provides lightweight timers and counters for finding where the time of a loss evaluation goes.
+Phases (such as starting SUMO or stepping the simulation) are timed with profile_phase and scopes (such as a call to
+get_response_times or a generation of an optimizer) are timed with profile_scope.
+Every phase and counter is added to the totals of the scopes which are open when it finishes, so each scope record
+breaks its time down by phase.
+Profiling is disabled by default, in which case the timers do nothing but check a flag.
+The statistics are kept per process, so simulations run in a SimulationPool are not included.
+"""
+
+import os
+import json
+import time
+import functools
+from collections import defaultdict
+
+
+class PhaseStatistics:
+    """This class accumulates the number of times a phase ran and how long it took (in seconds)."""
+
+    def __init__(self):
+
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+
+    def to_dict(self):
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count if self.count else 0.0,
+                "min": self.min if self.count else 0.0,
+                "max": self.max}
+
+
+class Profiler:
+    """This class stores the statistics of the profiled phases, counters, and scopes of a process."""
+
+    def __init__(self):
+
+        self.enabled = False
+        self.trace = False
+        self.reset()
+
+    def reset(self):
+        """Removes all of the recorded statistics and trace events."""
+
+        self.phases = defaultdict(PhaseStatistics)
+        self.counters = defaultdict(int)
+        self.scope_records = defaultdict(list)
+        self.open_scopes = []
+        self.trace_events = []
+        self.start_time = time.perf_counter()
+
+    def record_phase(self, name, start_time, duration):
+        """Adds a finished phase to the statistics and to each open scope."""
+
+        self.phases[name].add(duration)
+        for scope in self.open_scopes:
+            phase = scope["phases"].setdefault(name, {"count": 0, "total": 0.0})
+            phase["count"] += 1
+            phase["total"] += duration
+        self.add_trace_event(name, "phase", start_time, duration)
+
+    def record_scope(self, scope, start_time, duration):
+        """Stores the record of a finished scope."""
+
+        scope["duration"] = duration
+        self.scope_records[scope["name"]].append(scope)
+        self.add_trace_event(scope["name"], "scope", start_time, duration)
+
+    def count(self, name, value=1):
+        """Adds the value to the counter and to the counters of each open scope."""
+
+        if not self.enabled:
+            return
+        self.counters[name] += value
+        for scope in self.open_scopes:
+            scope["counters"][name] = scope["counters"].get(name, 0) + value
+
+    def add_trace_event(self, name, category, start_time, duration):
+        """Adds a complete event in the Chrome trace format when tracing is enabled."""
+
+        if self.trace:
+            self.trace_events.append({"name": name,
+                                      "cat": category,
+                                      "ph": "X",
+                                      "ts": (start_time - self.start_time) * 1e6,
+                                      "dur": duration * 1e6,
+                                      "pid": os.getpid(),
+                                      "tid": 0})
+
+    def get_statistics(self):
+        """
+        Returns a dictionary of the statistics of each phase, the totals of each counter, and a list of the records of
+        each scope.
+        Each scope record contains its duration and the total time and count of each phase and counter within it.
+        """
+
+        return {"phases": {name: statistics.to_dict() for name, statistics in self.phases.items()},
+                "counters": dict(self.counters),
+                "scopes": {name: list(records) for name, records in self.scope_records.items()}}
+
+    def save_trace(self, trace_file_path):
+        """Saves the trace events to a file which can be opened in chrome://tracing or Perfetto."""
+
+        with open(trace_file_path, 'w') as f:
+            json.dump({"traceEvents": self.trace_events, "displayTimeUnit": "ms"}, f)
+
+
+class ProfileTimer:
+    """
+    This class times a phase or scope when used as a context manager.
+    It can also decorate a function, in which case every call of the function is timed.
+    """
+
+    def __init__(self, profiler, name, is_scope=False):
+
+        self.profiler = profiler
+        self.name = name
+        self.is_scope = is_scope
+        self.start_time = None
+        self.scope = None
+
+    def __enter__(self):
+
+        if self.profiler.enabled:
+            self.start_time = time.perf_counter()
+            if self.is_scope:
+                self.scope = {"name": self.name, "phases": {}, "counters": {}}
+                self.profiler.open_scopes.append(self.scope)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if self.start_time is None:
+            return
+        duration = time.perf_counter() - self.start_time
+        if self.is_scope:
+            self.profiler.open_scopes.remove(self.scope)
+            self.profiler.record_scope(self.scope, self.start_time, duration)
+        else:
+            self.profiler.record_phase(self.name, self.start_time, duration)
+        self.start_time = None
+
+    def __call__(self, function):
+
+        @functools.wraps(function)
+        def profiled_function(*args, **kwargs):
+            with ProfileTimer(self.profiler, self.name, self.is_scope):
+                return function(*args, **kwargs)
+
+        return profiled_function
+
+
+profiler = Profiler()  # the profiler shared by the whole process
+
+
+def profile_phase(name):
+    """Returns a timer for the phase which can be used as a context manager or a function decorator."""
+
+    return ProfileTimer(profiler, name)
+
+
+def profile_scope(name):
+    """Returns a timer for the scope which can be used as a context manager or a function decorator."""
+
+    return ProfileTimer(profiler, name, is_scope=True)
+
+
+def count(name, value=1):
+    """Adds the value to the named counter."""
+
+    profiler.count(name, value)
+
+
+def enable_profiling(trace=False):
+    """Starts recording profile statistics, along with trace events if trace is True."""
+
+    profiler.enabled = True
+    profiler.trace = trace
+
+
+def disable_profiling():
+    """Stops recording profile statistics without removing the statistics recorded so far."""
+
+    profiler.enabled = False
+    profiler.trace = False
+
+
+def reset_profiling():
+    """Removes all of the recorded profile statistics and trace events."""
+
+    profiler.reset()
+
+
+def get_profile_statistics():
+    """Returns a dictionary of the recorded phase statistics, counters, and scope records."""
+
+    return profiler.get_statistics()
+
+
+def save_trace(trace_file_path):
+    """Saves the recorded trace events to a file in the Chrome trace format."""
+
+    profiler.save_trace(trace_file_path)
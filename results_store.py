@@ -0,0 +1,300 @@
+"""
+This file provides an append-only columnar store for optimization results.
+Each table is written as a series of compressed .npz chunks with one row per record, so runs (and worker processes)
+only ever add new files.
+The evaluations table holds one row for each evaluated set of station placements, including the raw simulated response
+times, and the fitness table holds the fitness reported by the algorithm at each generation along with the
+algorithm's evaluation report for the run.
+"""
+
+import os
+import json
+import time
+import itertools
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+
+EVALUATIONS_TABLE = "evaluations"
+FITNESS_TABLE = "fitness"
+RAGGED_COLUMNS = ("placement", "response_times")  # columns whose rows are arrays of differing lengths
+STRING_COLUMNS = ("experiment", "loss", "parameter_value", "report")
+
+
+class ResultsStore:
+    """This class appends rows to the tables of a results directory and loads them back as data frames."""
+
+    def __init__(self, directory, chunk_size=1000):
+
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.buffers = defaultdict(list)
+        self.chunk_counter = itertools.count()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def append(self, table, **row):
+        """Buffers a row for the table, writing a chunk once enough rows have been buffered."""
+
+        self.buffers[table].append(row)
+        if len(self.buffers[table]) >= self.chunk_size:
+            self.flush(table)
+
+    def append_evaluation(self, experiment, loss, parameter_value, seed, generation, placement, response_times,
+                          loss_value, wall_time):
+        """Adds a row recording an evaluation of a set of station placements."""
+
+        self.append(EVALUATIONS_TABLE,
+                    experiment=experiment,
+                    loss=loss,
+                    parameter_value=json.dumps(parameter_value),
+                    seed=seed,
+                    generation=generation,
+                    placement=np.asarray(placement, dtype=float).reshape(-1, 2),
+                    response_times=np.asarray(response_times, dtype=float),
+                    loss_value=loss_value,
+                    wall_time=wall_time)
+
+    def append_fitness_history(self, experiment, loss, parameter_value, seed, fitness_values, report=None):
+        """
+        Adds a row for the fitness of each generation of an optimization run.
+        The evaluation report of the algorithm (a dictionary of counts) is stored with each row.
+        """
+
+        for generation, fitness in enumerate(fitness_values):
+            self.append(FITNESS_TABLE,
+                        experiment=experiment,
+                        loss=loss,
+                        parameter_value=json.dumps(parameter_value),
+                        seed=seed,
+                        generation=generation,
+                        fitness=fitness,
+                        report=json.dumps(report or {}))
+        self.flush(FITNESS_TABLE)
+
+    def flush(self, table=None):
+        """Writes the buffered rows of the table (or of every table) to new chunk files."""
+
+        tables = [table] if table is not None else list(self.buffers)
+        for table in tables:
+            rows = self.buffers.pop(table, [])
+            if not rows:
+                continue
+
+            # store ragged columns as concatenated values with offsets marking where each row starts
+            columns = {}
+            for name in rows[0]:
+                values = [row[name] for row in rows]
+                if name in RAGGED_COLUMNS:
+                    columns[f"{name}_values"] = np.concatenate(values)
+                    columns[f"{name}_offsets"] = np.cumsum([0] + [len(value) for value in values])
+                    columns[f"{name}_shape"] = np.array(values[0].shape[1:], dtype=int)
+                elif name in STRING_COLUMNS:
+                    columns[name] = np.array(values, dtype=str)
+                else:
+                    columns[name] = np.array(values)
+
+            file_name = f"{table}-{os.getpid()}-{int(time.time() * 1000)}-{next(self.chunk_counter)}.npz"
+            np.savez_compressed(os.path.join(self.directory, file_name), **columns)
+
+    def load(self, table):
+        """Returns a data frame containing every row of the table."""
+
+        self.flush(table)
+        frames = []
+        for file_name in sorted(os.listdir(self.directory)):
+            if file_name.startswith(f"{table}-") and file_name.endswith(".npz"):
+                frames.append(load_chunk(os.path.join(self.directory, file_name)))
+        if not frames:
+            return pd.DataFrame()
+
+        return pd.concat(frames, ignore_index=True)
+
+
+def load_chunk(file_path):
+    """Returns a data frame containing the rows of a single chunk file."""
+
+    columns = {}
+    with np.load(file_path) as chunk:
+        for name in chunk.files:
+            if name.endswith("_values"):
+                column = name[:-len("_values")]
+                values, offsets = chunk[name], chunk[f"{column}_offsets"]
+                values = values.reshape((-1, *chunk[f"{column}_shape"]))
+                columns[column] = [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+            elif not name.endswith("_offsets") and not name.endswith("_shape"):
+                columns[name] = chunk[name]
+
+    return pd.DataFrame(columns)
+
+
+class RecordingLoss:
+    """
+    This class wraps a loss function and records each evaluation in a results store.
+    If the loss provides evaluate_batch_with_samples the raw response times are recorded as well, but only for the
+    evaluations which simulated them, so cached response times are not counted again.
+    If the loss supports racing, raced evaluations are recorded along with the response times simulated by the race.
+    The generation attribute should be updated by whoever runs the optimization algorithm.
+    """
+
+    def __init__(self, loss_function, store, experiment, loss, parameter_value, seed):
+
+        self.loss_function = loss_function
+        self.store = store
+        self.experiment = experiment
+        self.loss = loss
+        self.parameter_value = parameter_value
+        self.seed = seed
+        self.generation = 0
+
+    def __call__(self, placements):
+        return self.evaluate_batch([placements])[0]
+
+    @property
+    def simulation_directory(self):
+        return self.loss_function.simulation_directory
+
+    @property
+    def parameters(self):
+        return getattr(self.loss_function, 'parameters', ())
+
+    def evaluate_batch(self, placement_sets):
+        """Returns the loss of each set of placements and records the evaluations."""
+
+        start_time = time.perf_counter()
+        if hasattr(self.loss_function, 'evaluate_batch_with_samples'):
+            losses, batch_response_times = self.loss_function.evaluate_batch_with_samples(placement_sets)
+        elif hasattr(self.loss_function, 'evaluate_batch'):
+            losses, batch_response_times = self.loss_function.evaluate_batch(placement_sets), None
+        else:
+            losses, batch_response_times = [self.loss_function(placements) for placements in placement_sets], None
+        wall_time = (time.perf_counter() - start_time) / max(1, len(placement_sets))
+
+        if batch_response_times is None:
+            batch_response_times = [[] for _ in placement_sets]
+        for placements, response_times, loss_value in zip(placement_sets, batch_response_times, losses):
+            self.record(placements, response_times, loss_value, wall_time)
+
+        return losses
+
+    def race(self, placements, threshold, confidence=0.95, chunk_size=5, max_simulations=None):
+        """
+        Races the placements against the threshold with the wrapped loss and records the evaluation.
+        Returns a tuple of the loss, the number of simulations run, and whether the loss is below the threshold.
+        """
+
+        loss, response_times, is_below = self.race_with_samples(placements,
+                                                                threshold,
+                                                                confidence,
+                                                                chunk_size,
+                                                                max_simulations)
+
+        return loss, len(response_times), is_below
+
+    def race_with_samples(self, placements, threshold, confidence=0.95, chunk_size=5, max_simulations=None):
+        """
+        Races the placements like race, but returns a tuple of the loss, the response times simulated, and whether the
+        loss is below the threshold.
+        """
+
+        if not hasattr(self.loss_function, 'race_with_samples'):
+            raise ValueError(f"{type(self.loss_function).__name__} does not support racing.")
+
+        start_time = time.perf_counter()
+        loss, response_times, is_below = self.loss_function.race_with_samples(placements,
+                                                                              threshold,
+                                                                              confidence,
+                                                                              chunk_size,
+                                                                              max_simulations)
+        self.record(placements, response_times, loss, time.perf_counter() - start_time)
+
+        return loss, response_times, is_below
+
+    def record(self, placements, response_times, loss_value, wall_time):
+        """Appends an evaluation of the placements to the results store."""
+
+        self.store.append_evaluation(self.experiment,
+                                     self.loss,
+                                     self.parameter_value,
+                                     self.seed,
+                                     self.generation,
+                                     placements,
+                                     response_times,
+                                     float(loss_value),
+                                     wall_time)
+
+
+def get_fitness_histories(store, experiment=None):
+    """
+    Returns a dictionary mapping (loss, parameter value, seed) to the list of fitness values of each generation.
+    If an experiment is passed, only its runs are returned.
+    """
+
+    fitness = store.load(FITNESS_TABLE)
+    if fitness.empty:
+        return {}
+    if experiment is not None:
+        fitness = fitness[fitness["experiment"] == experiment]
+
+    histories = {}
+    for (loss, parameter_value, seed), rows in fitness.groupby(["loss", "parameter_value", "seed"]):
+        histories[(loss, json.loads(parameter_value), int(seed))] = list(rows.sort_values("generation")["fitness"])
+
+    return histories
+
+
+def get_evaluation_reports(store, experiment=None):
+    """
+    Returns a dictionary mapping (loss, parameter value, seed) to the evaluation report of the optimization run.
+    If an experiment is passed, only its runs are returned.
+    """
+
+    fitness = store.load(FITNESS_TABLE)
+    if fitness.empty or "report" not in fitness:
+        return {}
+    if experiment is not None:
+        fitness = fitness[fitness["experiment"] == experiment]
+
+    reports = {}
+    for (loss, parameter_value, seed), rows in fitness.groupby(["loss", "parameter_value", "seed"]):
+        report = rows["report"].iloc[0]
+        reports[(loss, json.loads(parameter_value), int(seed))] = json.loads(report) if isinstance(report, str) else {}
+
+    return reports
+
+
+def get_response_time_statistics(store, statistics, experiment=None):
+    """
+    Returns a data frame of each response time statistic over all of the recorded samples of each loss and parameter
+    value, along with the number of samples and the total wall time spent evaluating.
+    The statistics are a dictionary mapping a name to a function of a list of response times.
+    """
+
+    evaluations = store.load(EVALUATIONS_TABLE)
+    if evaluations.empty:
+        return pd.DataFrame()
+    if experiment is not None:
+        evaluations = evaluations[evaluations["experiment"] == experiment]
+
+    rows = []
+    groups = evaluations.groupby(["experiment", "loss", "parameter_value"])
+    for (experiment_name, loss, parameter_value), group in groups:
+        response_times = np.concatenate(list(group["response_times"]))
+        row = {"experiment": experiment_name,
+               "loss": loss,
+               "parameter_value": json.loads(parameter_value),
+               "num_samples": len(response_times),
+               "wall_time": group["wall_time"].sum()}
+        if len(response_times):
+            row.update({name: statistic(response_times) for name, statistic in statistics.items()})
+        rows.append(row)
+
+    return pd.DataFrame(rows)
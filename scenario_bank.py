@@ -0,0 +1,127 @@
+"""
+This file provides a bank of pre-generated emergency scenarios.
+Each scenario is an emergency edge, the (lat, lon) of the emergency, and the seed SUMO uses for the background traffic.
+Evaluating every station placement on the same scenarios (common random numbers) means the difference between two
+placements is not hidden by the difference between the emergencies they happened to be tested on.
+"""
+
+import os
+import hashlib
+
+import numpy as np
+
+from sumo_interface import get_emergency_edge_index, get_network_file_path
+
+
+MAX_SUMO_SEED = 2 ** 31 - 1  # SUMO seeds must fit in a signed 32 bit integer
+
+
+class ScenarioBank:
+    """This class stores emergency scenarios as arrays which can be sliced, saved, and loaded."""
+
+    def __init__(self, edge_ids, latitudes, longitudes, seeds, seed=None):
+
+        self.edge_ids = np.asarray(edge_ids, dtype=object)
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.seeds = np.asarray(seeds, dtype=np.int64)
+        self.seed = seed  # the seed the bank was generated with
+
+    def __len__(self):
+        return len(self.edge_ids)
+
+    def __getitem__(self, index):
+        """
+        Returns a tuple of (edge ID, lat, lon, seed) for an integer index or a bank of the scenarios for a slice or an
+        array of indices.
+        """
+
+        if not isinstance(index, (int, np.integer)):
+            return ScenarioBank(self.edge_ids[index],
+                                self.latitudes[index],
+                                self.longitudes[index],
+                                self.seeds[index],
+                                self.seed)
+
+        return self.edge_ids[index], self.latitudes[index], self.longitudes[index], int(self.seeds[index])
+
+    @property
+    def digest(self):
+        """Returns a hash of the scenarios, which changes when a bank with the same seed is regenerated differently."""
+
+        digest = hashlib.sha1()
+        for array in (self.edge_ids.astype(str), self.latitudes, self.longitudes, self.seeds):
+            digest.update(np.ascontiguousarray(array).tobytes())
+
+        return digest.hexdigest()
+
+    @classmethod
+    def generate(cls, network_file_path, num_scenarios, seed=0, weighted=True):
+        """
+        Draws the number of scenarios from the emergency edges of the network.
+        The emergencies and traffic seeds are drawn from separate streams, so a larger bank generated with the same seed
+        starts with the scenarios of a smaller one.
+        """
+
+        emergency_rng, traffic_rng = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(2)]
+        edge_ids, latitudes, longitudes = get_emergency_edge_index(network_file_path).sample(num_scenarios,
+                                                                                             emergency_rng,
+                                                                                             weighted)
+        seeds = traffic_rng.integers(0, MAX_SUMO_SEED, num_scenarios)
+
+        return cls(edge_ids, latitudes, longitudes, seeds, seed)
+
+    def save(self, file_path):
+        """
+        Saves the scenarios to a .npz file.
+        The scenarios are written to a temporary file which then replaces the file, so processes saving the same bank at
+        the same time never load a partly written bank.
+        """
+
+        temporary_file_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temporary_file_path, 'wb') as f:
+            np.savez(f,
+                     edge_ids=self.edge_ids.astype(str),
+                     latitudes=self.latitudes,
+                     longitudes=self.longitudes,
+                     seeds=self.seeds,
+                     seed=np.array(-1 if self.seed is None else self.seed))
+        os.replace(temporary_file_path, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """Loads the scenarios saved in a .npz file."""
+
+        with np.load(file_path) as scenarios:
+            seed = int(scenarios["seed"])
+            return cls(scenarios["edge_ids"],
+                       scenarios["latitudes"],
+                       scenarios["longitudes"],
+                       scenarios["seeds"],
+                       None if seed == -1 else seed)
+
+
+def get_scenario_bank_file_path(simulation_directory, seed=0):
+    """Returns the file path to the scenario bank generated with the seed."""
+
+    return os.path.join(simulation_directory, f'scenarios_{seed}.npz')
+
+
+def get_scenario_bank(simulation_directory, num_scenarios, seed=0):
+    """
+    Returns a bank of the number of scenarios for the simulation.
+    The bank is loaded from the simulation directory, and is generated and saved there if it does not exist yet (or is
+    out of date or too small), so every run with the same seed uses the same scenarios.
+    """
+
+    file_path = get_scenario_bank_file_path(simulation_directory, seed)
+    network_file_path = get_network_file_path(simulation_directory)
+    if os.path.exists(file_path) and os.path.getmtime(file_path) >= os.path.getmtime(network_file_path):
+        scenarios = ScenarioBank.load(file_path)
+        if len(scenarios) >= num_scenarios:
+            return scenarios[:num_scenarios]
+
+    scenarios = ScenarioBank.generate(network_file_path, num_scenarios, seed)
+    scenarios.save(file_path)
+
+    return scenarios
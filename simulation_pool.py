@@ -0,0 +1,105 @@
+"""
+This file provides a pool of worker processes which each run their own SUMO instance.
+The pool spreads the simulations of a single call to get_response_times across all of the cores.
+"""
+
+import os
+import random
+import multiprocessing
+
+import sumo_interface
+
+
+def run_worker_simulations(data_directory, station_coordinates, num_simulations, seed, kwargs):
+    """Runs a share of the simulations inside a worker process and returns the resulting response times."""
+
+    random.seed(seed)
+    try:
+        return sumo_interface.get_response_times(data_directory, station_coordinates, num_simulations, **kwargs)
+    except Exception:
+        # make sure the worker's SUMO connection does not outlive the failed simulations
+        try:
+            sumo_interface.close_simulation()
+        except Exception:
+            pass
+        raise
+
+
+class SimulationPool:
+    """
+    This class manages a pool of worker processes which each own a SUMO instance.
+    Response times are reproducible under a seed because each worker's share of the simulations is seeded in order.
+    """
+
+    def __init__(self, num_workers=None, seed=None):
+
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.random = random.Random(seed) if seed is not None else random
+        self.pool = multiprocessing.Pool(self.num_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def get_response_times(self, data_directory, station_coordinates, num_simulations=10, **kwargs):
+        """
+        Runs the simulations across the workers and returns the resulting response times.
+        Takes the same arguments as sumo_interface.get_response_times.
+        """
+
+        return self.get_batch_response_times(data_directory, [station_coordinates], num_simulations, **kwargs)[0]
+
+    def get_batch_response_times(self, data_directory, station_coordinate_sets, num_simulations=10, **kwargs):
+        """
+        Runs the simulations of every set of station coordinates across the workers at the same time.
+        Returns a list containing the list of response times of each set of station coordinates.
+        """
+
+        if num_simulations <= 0:
+            return [[] for _ in station_coordinate_sets]
+
+        # split the simulations of each set as evenly as possible between the workers
+        num_chunks = min(self.num_workers, num_simulations)
+        chunk_sizes = [num_simulations // num_chunks + (i < num_simulations % num_chunks) for i in range(num_chunks)]
+        # each chunk simulates its own slice of the scenarios when a scenario bank is passed
+        scenarios = kwargs.pop("scenarios", None)
+        chunk_starts = [sum(chunk_sizes[:i]) for i in range(num_chunks)]
+        jobs = []
+        for station_coordinates in station_coordinate_sets:
+            for chunk_start, chunk_size in zip(chunk_starts, chunk_sizes):
+                seed = self.random.getrandbits(32)
+                chunk_kwargs = kwargs
+                if scenarios is not None:
+                    chunk_kwargs = dict(kwargs, scenarios=scenarios[chunk_start:chunk_start + chunk_size])
+                jobs.append((data_directory, list(station_coordinates), chunk_size, seed, chunk_kwargs))
+
+        # run the simulations and combine the results in a fixed order
+        try:
+            results = self.pool.starmap(run_worker_simulations, jobs)
+        except BaseException:
+            self.terminate()
+            raise
+
+        response_times = []
+        for i in range(len(station_coordinate_sets)):
+            chunks = results[i * num_chunks:(i + 1) * num_chunks]
+            response_times.append([response_time for chunk in chunks for response_time in chunk])
+
+        return response_times
+
+    def close(self):
+        """Waits for the workers to finish and shuts them down."""
+
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        """Stops the workers immediately."""
+
+        self.pool.terminate()
+        self.pool.join()
@@ -2,10 +2,14 @@
 
 import os
 import sys
-import random
+import pickle
+import tempfile
 import warnings
+from collections import OrderedDict
 
+import numpy as np
 import pyproj
+from scipy.spatial import cKDTree
 # these imports are required for SUMO
 if 'SUMO_HOME' in os.environ:
     sumo_tools_directory = os.path.join(os.environ['SUMO_HOME'], 'tools')
@@ -13,44 +17,173 @@ if 'SUMO_HOME' in os.environ:
 else:
     raise ModuleNotFoundError("Install SUMO and the environmental variable 'SUMO_HOME' will be automatically set.")
 import traci
+import traci.constants as tc
 import sumolib
+try:
+    import libsumo
+except ImportError:
+    libsumo = None
 
 from file_paths import get_simulation_data_file_path
-
-
+from network_index import EmergencyEdgeIndex, EdgeSnapIndex, convert_xy_to_lat_lon
+from compact_network import save_compact_network, load_compact_network, get_compact_network_directory, \
+    remove_stale_compact_networks
+from profiling import profile_phase, profile_scope, count
+
+
+EARTH_RADIUS = 6371008.8  # the mean radius of the earth in meters
+KD_TREE_STATION_THRESHOLD = 64  # the number of stations above which nearest stations are found with a KD-tree
+PREPARATION_TIME = 75  # the time (in seconds) it takes the fire fighters to leave the station
+ARRIVAL_CHECK_INTERVAL = 30  # the time (in seconds) the simulation jumps between checks for arrived emergency vehicles
+EMERGENCY_STOP_DURATION = 86400  # the time (in seconds) an emergency vehicle stays parked at its emergency
+NETWORK_CACHE_SIZE = 4  # the maximum number of parsed networks kept in memory
+_network_cache = OrderedDict()  # maps an absolute network file path to a tuple of (modification time, network)
+_network_index_cache = {}  # maps a tuple of (absolute network file path, index class) to a tuple of (network, index)
+SIMULATION_BACKENDS = {"traci": traci, "libsumo": libsumo}  # maps the name of each backend to the module providing it
+_simulation_backend = "libsumo" if libsumo is not None else "traci"  # the backend used to run simulations without a GUI
+_simulation = None  # the backend module controlling the running simulation
+NETWORK_FORMATS = ("xml", "compact")  # the formats the network indexes and bounds can be built from
+_network_format = "xml"  # the format the network indexes and bounds are built from
+_compact_network_cache = {}  # maps an absolute network file path to its memory-mapped compact network
+
+
+@profile_scope("get_response_times")
 def get_response_times(data_directory,
                        station_coordinates,
                        num_simulations=10,
                        gui=False,
                        auto_start_close=False,
                        prior_time=400,
-                       max_time=5000):
-    """This function will run multiple simulations in SUMO and return the resulting response times."""
+                       max_time=5000,
+                       reuse_warm_up=False,
+                       batch_dispatch=False,
+                       isolate_vehicles=True,
+                       backend=None,
+                       scenarios=None):
+    """
+    This function will run multiple simulations in SUMO and return the resulting response times.
+    If reuse_warm_up is True, the background traffic is simulated once and each emergency starts from a saved state.
+    If batch_dispatch is True, every emergency vehicle is dispatched within a single simulation.
+    If isolate_vehicles is True as well, SUMO ignores every collision in that simulation (--collision.action none is a
+    global option), so the emergency vehicles, which also ignore safe speeds, pass through the background traffic as
+    well as through each other.
+    Batched response times are therefore not directly comparable to those of separate simulations, where the vehicle
+    stays subject to the collision handling of the configuration.
+    The backend is the name of the simulation backend to use, which defaults to the one set by set_simulation_backend.
+    If a ScenarioBank is passed, the emergencies and traffic seeds are taken from its first num_simulations scenarios
+    instead of being drawn at random (when all of the emergencies share one simulation the first seed is used).
+    """
 
-    response_times = []
     config_file_path = get_config_file_path(data_directory)
     net_file_path = get_network_file_path(data_directory)
+    if scenarios is not None:
+        if len(scenarios) < num_simulations:
+            raise ValueError(f"{num_simulations} simulations were requested but the scenario bank only contains "
+                             f"{len(scenarios)} scenarios.")
+        scenarios = scenarios[:num_simulations]
+
+    if batch_dispatch:
+        # this disables the collisions of every vehicle, not only those between the emergency vehicles
+        additional_options = ['--collision.action', 'none'] if isolate_vehicles else []
+        emergencies = None
+        if scenarios is not None and num_simulations > 0:
+            additional_options += ['--seed', str(scenarios.seeds[0])]
+            emergencies = (scenarios.edge_ids, scenarios.latitudes, scenarios.longitudes)
+        start_simulation(config_file_path, gui, auto_start_close, additional_options, backend)
+        try:
+            response_times = respond_to_emergencies(net_file_path,
+                                                    station_coordinates,
+                                                    num_simulations,
+                                                    prior_time=prior_time,
+                                                    max_time=max_time,
+                                                    emergencies=emergencies)
+        finally:
+            close_simulation()
+        return response_times
+
+    if reuse_warm_up:
+        return get_response_times_from_warm_up_state(config_file_path,
+                                                     net_file_path,
+                                                     station_coordinates,
+                                                     num_simulations,
+                                                     gui,
+                                                     auto_start_close,
+                                                     prior_time,
+                                                     max_time,
+                                                     backend,
+                                                     scenarios)
 
-    for _ in range(num_simulations):
-        start_simulation(config_file_path, gui, auto_start_close)
+    response_times = []
+    for i in range(num_simulations):
+        additional_options, emergency = None, None
+        if scenarios is not None:
+            edge_id, latitude, longitude, seed = scenarios[i]
+            additional_options, emergency = ['--seed', str(seed)], (edge_id, latitude, longitude)
+        start_simulation(config_file_path, gui, auto_start_close, additional_options, backend)
         response_times.append(respond_to_emergency(net_file_path,
                                                    station_coordinates,
                                                    prior_time=prior_time,
-                                                   max_time=max_time))
+                                                   max_time=max_time,
+                                                   emergency=emergency))
         close_simulation()
 
     return response_times
 
 
-def start_simulation(config_file_path, gui=False, auto_start_close=True):
-    """Starts a simulation in SUMO."""
+def get_response_times_from_warm_up_state(config_file_path,
+                                          net_file_path,
+                                          station_coordinates,
+                                          num_simulations=10,
+                                          gui=False,
+                                          auto_start_close=False,
+                                          prior_time=400,
+                                          max_time=5000,
+                                          backend=None,
+                                          scenarios=None):
+    """
+    Runs the warm up traffic once, saves the simulation state, and responds to each emergency from that state.
+    All of the emergencies are simulated within a single SUMO process.
+    If a ScenarioBank is passed, the emergencies are taken from it and the traffic uses the seed of its first scenario.
+    """
+
+    response_times = []
+    state_file_descriptor, state_file_path = tempfile.mkstemp(suffix='.xml')
+    os.close(state_file_descriptor)
+
+    additional_options = None
+    if scenarios is not None and num_simulations > 0:
+        additional_options = ['--seed', str(scenarios.seeds[0])]
+    start_simulation(config_file_path, gui, auto_start_close, additional_options, backend)
+    try:
+        warm_up_simulation(prior_time, max_time)
+        with profile_phase("save_state"):
+            get_simulation().simulation.saveState(state_file_path)
+        for i in range(num_simulations):
+            with profile_phase("load_state"):
+                get_simulation().simulation.loadState(state_file_path)
+            response_times.append(respond_to_emergency(net_file_path,
+                                                       station_coordinates,
+                                                       prior_time=prior_time,
+                                                       max_time=max_time,
+                                                       vehicle_id=f"fire_truck_{i}",
+                                                       emergency=scenarios[i][:3] if scenarios is not None else None))
+    finally:
+        close_simulation()
+        os.remove(state_file_path)
+
+    return response_times
 
-    # find the SUMO file path
-    if gui:
-        sumo_executable = 'sumo-gui.exe'
-    else:
-        sumo_executable = 'sumo.exe'
-    sumo_file_path = os.path.join(os.environ['SUMO_HOME'], 'bin', sumo_executable)
+
+def start_simulation(config_file_path, gui=False, auto_start_close=True, additional_options=None, backend=None):
+    """
+    Starts a simulation in SUMO with the named backend (the one set by set_simulation_backend by default).
+    Simulations with a GUI always use the traci backend since libsumo runs SUMO in process without one.
+    """
+
+    global _simulation
+
+    # find the SUMO executable for this platform
+    sumo_file_path = sumolib.checkBinary('sumo-gui' if gui else 'sumo')
 
     # construct the sumo command
     sumo_command = [sumo_file_path, "-c", config_file_path]
@@ -58,102 +191,364 @@ def start_simulation(config_file_path, gui=False, auto_start_close=True):
         sumo_command.append('--start')
         sumo_command.append('--quit-on-end')
     sumo_command.append('--no-warnings')
+    if additional_options:
+        sumo_command.extend(additional_options)
 
     # call the command to start the simulation
-    traci.start(sumo_command)
+    simulation = get_simulation_backend("traci" if gui else backend)
+    with profile_phase("start_simulation"):
+        simulation.start(sumo_command)
+    _simulation = simulation
 
 
-def respond_to_emergency(net_file_path, station_coordinates, prior_time=400, max_time=5000):
+def set_simulation_backend(backend):
+    """
+    Sets the backend used to run simulations without a GUI.
+    The backend is "libsumo", which runs SUMO within this process, or "traci", which controls a SUMO process through a
+    socket and is useful for debugging.
+    """
+
+    global _simulation_backend
+
+    get_simulation_backend(backend)
+    _simulation_backend = backend
+
+
+def get_simulation_backend(backend=None):
+    """Returns the module of the named backend (or of the backend set by set_simulation_backend if none is passed)."""
+
+    backend = backend or _simulation_backend
+    if backend not in SIMULATION_BACKENDS:
+        raise ValueError(f"Unknown simulation backend {backend}, expected one of {list(SIMULATION_BACKENDS)}.")
+    if SIMULATION_BACKENDS[backend] is None:
+        raise ModuleNotFoundError(f"The {backend} simulation backend is not installed.")
+
+    return SIMULATION_BACKENDS[backend]
+
+
+def get_simulation():
+    """Returns the backend module controlling the running simulation."""
+
+    if _simulation is None:
+        raise RuntimeError("No simulation is running, start one with start_simulation.")
+
+    return _simulation
+
+
+@profile_phase("warm_up_simulation")
+def warm_up_simulation(prior_time=400, max_time=5000):
+    """
+    Runs the simulation until the prior time so that background traffic can flow.
+    The simulation jumps straight to the prior time in a single call rather than being stepped one step at a time.
+    """
+
+    simulation = get_simulation()
+    target_time = min(prior_time, max_time)
+    if simulation.simulation.getTime() < target_time:
+        simulation.simulationStep(target_time)
+
+
+def respond_to_emergency(net_file_path,
+                         station_coordinates,
+                         prior_time=400,
+                         max_time=5000,
+                         vehicle_id="fire_truck",
+                         emergency=None):
     """
     This function creates an emergency, finds the nearest station, and sends the emergency vehicle.
     It returns the amount of time (in seconds) it takes for the emergency vehicle to arrive on scene.
+    The emergency is drawn at random unless a tuple of its (edgeID, lat, lon) is passed.
     """
 
     # find the edges of the source and destination
-    emergency_edge, emergency_lat, emergency_lon = get_emergency(net_file_path)
+    emergency_edge, emergency_lat, emergency_lon = emergency or get_emergency(net_file_path)
     station_coordinate = get_closest_station(station_coordinates, (emergency_lat, emergency_lon))
     station_edge = get_edge_id_from_gps(net_file_path, station_coordinate)
 
     # run the simulation a little to allow traffic to flow
-    while traci.simulation.getTime() < prior_time and traci.simulation.getTime() < max_time:
-        traci.simulationStep()
+    warm_up_simulation(prior_time, max_time)
 
     # create the emergency vehicle and send it from the source to the destination
-    traci.route.add("trip", [station_edge, emergency_edge])
-    traci.vehicle.add("fire_truck", "trip")
-    traci.vehicle.setVehicleClass("fire_truck", "emergency")
-    traci.vehicle.setSpeedFactor("fire_truck", 1.5)
-    traci.vehicle.setSpeedMode("fire_truck", 0)
-    traci.vehicle.setColor("fire_truck", (255, 0, 0, 255))
-    traci.vehicle.setShapeClass("fire_truck", "truck")
+    dispatch_emergency_vehicle(vehicle_id, station_edge, emergency_edge)
 
     # track how long the emergency vehicle takes to arrive on scene
-    while 'fire_truck' not in traci.simulation.getArrivedIDList():
-        traci.simulationStep()
-
-    # compute the response time
-    preparation_time = 75
-    travel_time = traci.simulation.getTime() - prior_time
-    response_time = preparation_time + travel_time
+    travel_time = wait_for_arrivals([vehicle_id], max_time)[vehicle_id]
+    response_time = PREPARATION_TIME + travel_time
 
     return response_time
 
 
+def respond_to_emergencies(net_file_path,
+                           station_coordinates,
+                           num_emergencies,
+                           prior_time=400,
+                           max_time=5000,
+                           emergencies=None):
+    """
+    This function creates a batch of emergencies and sends an emergency vehicle from the nearest station to each one.
+    All of the vehicles are dispatched at the same time in the same simulation.
+    It returns a list of the response times (in seconds) in the order the emergencies were created.
+    The emergencies are drawn at random unless a tuple of arrays of their (edgeIDs, lats, lons) is passed.
+    """
+
+    # find the edges of the sources and destinations
+    if emergencies is None:
+        emergencies = get_emergencies(net_file_path, num_emergencies)
+    emergency_edges, emergency_lats, emergency_lons = emergencies
+    station_indices, _ = get_closest_stations(np.column_stack((emergency_lats, emergency_lons)), station_coordinates)
+    used_station_indices = sorted(set(station_indices))
+    used_station_edges = get_edge_ids_from_gps(net_file_path, [station_coordinates[i] for i in used_station_indices])
+    station_edges = dict(zip(used_station_indices, used_station_edges))
+
+    # run the simulation a little to allow traffic to flow
+    warm_up_simulation(prior_time, max_time)
+
+    # create the emergency vehicles and send each one from its station to its emergency
+    vehicle_ids = [f"fire_truck_{i}" for i in range(num_emergencies)]
+    for vehicle_id, station_index, emergency_edge in zip(vehicle_ids, station_indices, emergency_edges):
+        dispatch_emergency_vehicle(vehicle_id, station_edges[station_index], emergency_edge)
+
+    # record how long each emergency vehicle takes to arrive on scene
+    travel_times = wait_for_arrivals(vehicle_ids, max_time)
+
+    return [PREPARATION_TIME + travel_times[vehicle_id] for vehicle_id in vehicle_ids]
+
+
+@profile_phase("wait_for_arrivals")
+def wait_for_arrivals(vehicle_ids, max_time=5000):
+    """
+    Runs the simulation until each of the vehicles has arrived (or the max time is reached) and returns a dictionary
+    mapping each vehicle ID to the time (in seconds) between its departure and its arrival.
+    Each vehicle ends its trip parked at a stop on its emergency edge, whose actual arrival time SUMO records, so the
+    simulation jumps ARRIVAL_CHECK_INTERVAL seconds at a time instead of being stepped until the arrivals are seen.
+    The stop state of each vehicle is subscribed to when it is dispatched, so SUMO returns the states with the response
+    to each jump and each vehicle's stop is only requested once it has parked.
+    Travel times are measured from when each vehicle actually departs, so time spent waiting to be inserted into the
+    network is not counted.
+    Vehicles that have not arrived by the max time (such as vehicles removed after teleporting) are given the penalty
+    travel time of the whole time between their dispatch and the max time, so the losses stay finite.
+    """
+
+    simulation = get_simulation()
+    time = simulation.simulation.getTime()
+    penalty_time = max(0, max_time - time)
+    travel_times = dict.fromkeys(vehicle_ids, penalty_time)
+    pending_vehicle_ids = list(vehicle_ids)
+    lost_vehicle_ids = []
+    num_jumps = 0
+    while pending_vehicle_ids and time < max_time:
+        time = min(time + ARRIVAL_CHECK_INTERVAL, max_time)
+        simulation.simulationStep(time)
+        num_jumps += 1
+        stop_states = simulation.vehicle.getAllSubscriptionResults()
+        for vehicle_id in list(pending_vehicle_ids):
+            if stop_states.get(vehicle_id, {}).get(tc.VAR_STOPSTATE) == 0:
+                continue  # the vehicle is still driving to its emergency
+
+            # the vehicle has parked, or is missing from the results because it has not been inserted or has left
+            try:
+                stops = simulation.vehicle.getStops(vehicle_id, 1)
+            except simulation.TraCIException:
+                stops = []
+            if not stops:
+                # the vehicle left the simulation or skipped its stop without reaching the emergency
+                lost_vehicle_ids.append(vehicle_id)
+                pending_vehicle_ids.remove(vehicle_id)
+            elif stops[0].arrival >= 0:
+                travel_times[vehicle_id] = stops[0].arrival - simulation.vehicle.getDeparture(vehicle_id)
+                pending_vehicle_ids.remove(vehicle_id)
+    count("arrival_checks", num_jumps)
+
+    if pending_vehicle_ids or lost_vehicle_ids:
+        warnings.warn(f"{len(pending_vehicle_ids) + len(lost_vehicle_ids)} emergency vehicles did not arrive on scene "
+                      f"by time {max_time}, so they were given the penalty travel time {penalty_time}.")
+
+    return travel_times
+
+
+@profile_phase("dispatch_emergency_vehicle")
+def dispatch_emergency_vehicle(vehicle_id, station_edge, emergency_edge):
+    """
+    Adds an emergency vehicle to the simulation which drives from the station edge to the emergency edge.
+    The vehicle departs from a free lane and position, so vehicles dispatched from the same station at the same time do
+    not queue behind each other to be inserted.
+    The vehicle parks at the end of the emergency edge, which keeps it in the simulation so its arrival time can be
+    read.
+    """
+
+    simulation = get_simulation()
+    route_id = f"{vehicle_id}_trip"
+    simulation.route.add(route_id, [station_edge, emergency_edge])
+    simulation.vehicle.add(vehicle_id, route_id, departLane="free", departPos="free")
+    simulation.vehicle.setVehicleClass(vehicle_id, "emergency")
+    simulation.vehicle.setSpeedFactor(vehicle_id, 1.5)
+    simulation.vehicle.setSpeedMode(vehicle_id, 0)
+    simulation.vehicle.setColor(vehicle_id, (255, 0, 0, 255))
+    simulation.vehicle.setShapeClass(vehicle_id, "truck")
+    lane_index, lane_length = get_emergency_lane(emergency_edge)
+    simulation.vehicle.setStop(vehicle_id,
+                               emergency_edge,
+                               pos=lane_length,
+                               laneIndex=lane_index,
+                               duration=EMERGENCY_STOP_DURATION,
+                               flags=tc.STOP_PARKING)
+    simulation.vehicle.subscribe(vehicle_id, [tc.VAR_STOPSTATE])
+
+
+def get_emergency_lane(edge_id):
+    """Returns a tuple of the index and length of the first lane of the edge that emergency vehicles can use."""
+
+    simulation = get_simulation()
+    for lane_index in range(simulation.edge.getLaneNumber(edge_id)):
+        lane_id = f"{edge_id}_{lane_index}"
+        allowed_classes = simulation.lane.getAllowed(lane_id)
+        if not allowed_classes or "emergency" in allowed_classes:
+            return lane_index, simulation.lane.getLength(lane_id)
+
+    raise ValueError(f"No lane of edge {edge_id} supports emergency vehicles.")
+
+
+@profile_phase("close_simulation")
 def close_simulation():
     """Closes the simulation in SUMO."""
 
-    traci.close()
+    global _simulation
+
+    simulation = get_simulation()
+    _simulation = None
+    simulation.close()
 
 
 def get_emergency(network_file_path):
     """Returns the edgeID and GPS coordinates of an emergency."""
 
-    net = get_network(network_file_path)
+    edge_IDs, latitudes, longitudes = get_emergencies(network_file_path, 1)
+
+    return edge_IDs[0], latitudes[0], longitudes[0]
+
+
+@profile_phase("get_emergencies")
+def get_emergencies(network_file_path, num_emergencies, rng=None, weighted=True):
+    """
+    Returns arrays of the edgeIDs, latitudes, and longitudes of a batch of emergencies.
+    Emergencies are drawn uniformly over the emergency edges unless demand weights have been set on the edge index.
+    """
+
+    index = get_emergency_edge_index(network_file_path)
+
+    return index.sample(num_emergencies, rng, weighted)
+
+
+def get_emergency_edge_index(network_file_path):
+    """Returns the index of edges that support emergency vehicles, building it the first time the network is used."""
+
+    return get_network_index(network_file_path, EmergencyEdgeIndex)
+
+
+def get_edge_snap_index(network_file_path):
+    """Returns the index for snapping coordinates to edges, building it the first time the network is used."""
 
-    # find a valid edge for emergency vehicle
-    edge = None
-    while not edge:
-        edge = random.choice(net.getEdges())
-        if not edge.allows("emergency"):
-            edge = None
+    return get_network_index(network_file_path, EdgeSnapIndex)
 
-    # get the ID, lat, and lon
-    edge_ID = edge.getID()
-    lon, lat = net.convertXY2LonLat(*edge.getToNode().getCoord())
 
-    return edge_ID, lat, lon
+def get_network_index(network_file_path, index_class):
+    """Returns the index of the passed class for the network, rebuilding it whenever the network is reloaded."""
+
+    key = (os.path.abspath(network_file_path), index_class)
+    net = get_indexed_network(network_file_path)
+    if key not in _network_index_cache or _network_index_cache[key][0] is not net:
+        with profile_phase(f"build {index_class.__name__}"):
+            _network_index_cache[key] = (net, index_class(net))
+
+    return _network_index_cache[key][1]
 
 
 def get_edge_id_from_gps(network_file_path, coordinate, search_radius=1000):
     """Returns the nearest edge to the passed coordinates that the emergency vehicle can depart from."""
 
-    # get a list of nearby edges
-    latitude, longitude = coordinate
-    net = get_network(network_file_path)
-    x, y = net.convertLonLat2XY(longitude, latitude)
-    edges = net.getNeighboringEdges(x, y, search_radius)
+    return get_edge_ids_from_gps(network_file_path, [coordinate], search_radius)[0]
+
+
+@profile_phase("get_edge_ids_from_gps")
+def get_edge_ids_from_gps(network_file_path, coordinates, search_radius=1000):
+    """
+    Takes a list of (lat, lon) coordinates.
+    Returns a list of the nearest edge to each coordinate that the emergency vehicle can depart from.
+    """
+
+    edge_ids, distances = get_edge_snap_index(network_file_path).query(coordinates)
+    edge_ids = list(edge_ids)
 
-    # return the closest allowed edge ID
-    edges = sorted(edges, key=lambda x: x[1])
-    for edge in edges:
-        if edge[0].allows("emergency"):
-            return edge[0].getID()
+    # if no valid edge is found raise a warning and use a random edge
+    for i in np.flatnonzero(distances > search_radius):
+        warnings.warn(f"Found no edges within search radius {search_radius} of coordinate {coordinates[i]} that "
+                      f"support emergency vehicles."
+                      f"\nCheck to make sure your coordinates are reasonable and consider increasing the search "
+                      f"radius.")
+        edge_ids[i] = get_emergency(network_file_path)[0]
 
-    # if no valid edge found raise a warning and return a random edge
-    warnings.warn(f"Found no edges within search radius {search_radius} of coordinate {coordinate} that support "
-                  f"emergency vehicles."
-                  f"\nCheck to make sure your coordinates are reasonable and consider increasing the search radius.")
-    return get_emergency(network_file_path)[0]
+    return edge_ids
+
+
+_geod = pyproj.Geod(ellps='WGS84')
 
 
 def get_distance(coordinates_1, coordinates_2):
     """Returns the distance between two GPS coordinates."""
 
-    geo_dist = pyproj.Geod(ellps='WGS84')
     lat_1, lon_1 = coordinates_1
     lat_2, lon_2 = coordinates_2
 
-    return geo_dist.inv(lon_1, lat_1, lon_2, lat_2)[2]
+    return _geod.inv(lon_1, lat_1, lon_2, lat_2)[2]
+
+
+def get_distances(coordinates_1, coordinates_2):
+    """
+    Returns the great circle distances (in meters) between arrays of GPS coordinates.
+    Each argument is an array whose last axis is (lat, lon) and the arrays are broadcast against each other.
+    """
+
+    coordinates_1 = np.radians(np.asarray(coordinates_1, dtype=float))
+    coordinates_2 = np.radians(np.asarray(coordinates_2, dtype=float))
+    lat_1, lon_1 = coordinates_1[..., 0], coordinates_1[..., 1]
+    lat_2, lon_2 = coordinates_2[..., 0], coordinates_2[..., 1]
+
+    # use the haversine formula
+    a = np.sin((lat_2 - lat_1) / 2) ** 2 + np.cos(lat_1) * np.cos(lat_2) * np.sin((lon_2 - lon_1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def get_unit_sphere_coordinates(coordinates):
+    """Returns an array of 3D points on the unit sphere for an array of (lat, lon) coordinates."""
+
+    coordinates = np.radians(np.asarray(coordinates, dtype=float))
+    lat, lon = coordinates[:, 0], coordinates[:, 1]
+
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def get_closest_stations(emergency_coordinates, station_coordinates):
+    """
+    First argument is an (E, 2) array of emergency coordinates where each row is (lat, lon).
+    Second argument is an (S, 2) array of station coordinates where each row is (lat, lon).
+    Returns an array of the index of the station nearest to each emergency and an array of the distances (in meters).
+    """
+
+    emergency_coordinates = np.asarray(emergency_coordinates, dtype=float).reshape(-1, 2)
+    station_coordinates = np.asarray(station_coordinates, dtype=float).reshape(-1, 2)
+
+    if len(station_coordinates) > KD_TREE_STATION_THRESHOLD:
+        # the straight line distance between points on a sphere increases with their great circle distance
+        tree = cKDTree(get_unit_sphere_coordinates(station_coordinates))
+        _, indices = tree.query(get_unit_sphere_coordinates(emergency_coordinates))
+        distances = get_distances(emergency_coordinates, station_coordinates[indices])
+    else:
+        all_distances = get_distances(emergency_coordinates[:, np.newaxis, :], station_coordinates[np.newaxis, :, :])
+        indices = np.argmin(all_distances, axis=1)
+        distances = all_distances[np.arange(len(emergency_coordinates)), indices]
+
+    return indices, distances
 
 
 def get_closest_station(station_coordinates, emergency_coordinate):
@@ -163,10 +558,9 @@ def get_closest_station(station_coordinates, emergency_coordinate):
     Returns a tuple containing the lat and lon of the fire station nearest to the coordinates.
     """
 
-    distances = [get_distance(s_c, emergency_coordinate) for s_c in station_coordinates]
-    min_index = distances.index(min(distances))
+    indices, _ = get_closest_stations([emergency_coordinate], station_coordinates)
 
-    return station_coordinates[min_index]
+    return station_coordinates[indices[0]]
 
 
 def get_network_coordinate_bounds(network_file_path):
@@ -175,6 +569,12 @@ def get_network_coordinate_bounds(network_file_path):
     network.
     """
 
+    if _network_format == "compact":
+        net = get_compact_network(network_file_path)
+        (min_x, min_y), (max_x, max_y) = net.get_bounding_box()
+        latitudes, longitudes = convert_xy_to_lat_lon(net, [min_x, max_x], [min_y, max_y])
+        return (latitudes[0], longitudes[0]), (latitudes[1], longitudes[1])
+
     net = get_network(network_file_path)
     coordinate_1 = net.convertXY2LonLat(*net.getBBoxXY()[0])
     coordinate_2 = net.convertXY2LonLat(*net.getBBoxXY()[1])
@@ -182,10 +582,150 @@ def get_network_coordinate_bounds(network_file_path):
     return (coordinate_1[1], coordinate_1[0]), (coordinate_2[1], coordinate_2[0])
 
 
-def get_network(network_file_path):
-    """Loads and returns the network object from the passed file path."""
+def get_network(network_file_path, use_snapshot=False):
+    """
+    Loads and returns the network object from the passed file path.
+    Parsed networks are cached by file path and modification time, so repeated calls reuse the same network object.
+    If use_snapshot is True, the network is loaded from (or saved to) a binary snapshot beside the XML file.
+    """
+
+    # reuse the cached network if the file has not changed since it was parsed
+    path = os.path.abspath(network_file_path)
+    modification_time = os.path.getmtime(path)
+    if path in _network_cache:
+        cached_modification_time, net = _network_cache[path]
+        if cached_modification_time == modification_time:
+            _network_cache.move_to_end(path)
+            return net
+        del _network_cache[path]
+
+    # parse the network, preferring the snapshot when one is requested
+    net = None
+    with profile_phase("get_network"):
+        if use_snapshot:
+            net = load_network_snapshot(path)
+        if net is None:
+            net = sumolib.net.readNet(path)
+            if use_snapshot:
+                save_network_snapshot(path, net)
+
+    # store the network and evict the least recently used networks
+    _network_cache[path] = (modification_time, net)
+    while len(_network_cache) > NETWORK_CACHE_SIZE:
+        _network_cache.popitem(last=False)
+
+    return net
+
+
+def clear_network_cache():
+    """Removes all of the parsed networks from the cache."""
+
+    _network_cache.clear()
+    _network_index_cache.clear()
+    _compact_network_cache.clear()
+
+
+def set_network_format(network_format):
+    """
+    Sets the format the network indexes, bounds, and travel time surrogate are built from.
+    The format is "xml", which parses the network with sumolib, or "compact", which memory-maps the compact array
+    format of the network (converting the network the first time) so processes share one copy of it.
+    """
+
+    global _network_format
+
+    if network_format not in NETWORK_FORMATS:
+        raise ValueError(f"Unknown network format {network_format}, expected one of {list(NETWORK_FORMATS)}.")
+    _network_format = network_format
+
+
+def get_indexed_network(network_file_path):
+    """Returns the network the indexes are built from, which is a parsed network or a compact network."""
+
+    if _network_format == "compact":
+        return get_compact_network(network_file_path)
+
+    return get_network(network_file_path)
+
+
+def get_compact_network(network_file_path):
+    """
+    Returns the memory-mapped compact format of the network.
+    The network is converted the first time it is used (and whenever the network file changes), which requires parsing
+    it, so convert the network before starting worker processes to avoid every worker parsing it.
+    """
 
-    return sumolib.net.readNet(network_file_path)
+    # reuse the loaded network if the file has not changed since it was converted
+    path = os.path.abspath(network_file_path)
+    modification_time = os.path.getmtime(path)
+    net = _compact_network_cache.get(path)
+    if net is not None and net.metadata["source_modification_time"] == modification_time:
+        return net
+
+    net = load_compact_network(path)
+    if net is None:
+        was_parsed = path in _network_cache
+        with profile_phase("convert_network"):
+            save_compact_network(get_network(path), get_compact_network_directory(path), path)
+        remove_stale_compact_networks(path)
+
+        # keeping the parsed network would keep the per-process copy the compact format exists to avoid
+        if not was_parsed:
+            _network_cache.pop(path, None)
+
+        net = load_compact_network(path)
+        if net is None:
+            raise RuntimeError(f"Unable to load the compact format of the network {path} from "
+                               f"{get_compact_network_directory(path)} after converting it.")
+    _compact_network_cache[path] = net
+
+    return net
+
+
+def get_network_snapshot_file_path(network_file_path):
+    """Returns the file path to the binary snapshot of the network."""
+
+    return network_file_path + '.pickle'
+
+
+def save_network_snapshot(network_file_path, net):
+    """Saves a binary snapshot of the parsed network so it can be loaded faster than the XML."""
+
+    # the network is a deeply linked graph of objects so pickling it requires a deep recursion
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, 100000))
+    try:
+        with open(get_network_snapshot_file_path(network_file_path), 'wb') as f:
+            pickle.dump((os.path.getmtime(network_file_path), net), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, RecursionError, TypeError) as e:
+        warnings.warn(f"Unable to save a snapshot of the network {network_file_path}: {e}")
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+
+def load_network_snapshot(network_file_path):
+    """Returns the network stored in the binary snapshot or None if there is no up to date snapshot."""
+
+    snapshot_file_path = get_network_snapshot_file_path(network_file_path)
+    if not os.path.exists(snapshot_file_path):
+        return None
+
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, 100000))
+    try:
+        with open(snapshot_file_path, 'rb') as f:
+            modification_time, net = pickle.load(f)
+    except (pickle.UnpicklingError, RecursionError, EOFError, AttributeError) as e:
+        warnings.warn(f"Unable to load the network snapshot {snapshot_file_path}: {e}")
+        return None
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    # ignore snapshots of an older version of the network
+    if modification_time != os.path.getmtime(network_file_path):
+        return None
+
+    return net
 
 
 def get_config_file_path(data_directory):
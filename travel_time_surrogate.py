@@ -0,0 +1,149 @@
+"""
+This file provides a fast estimate of response times which does not run SUMO.
+The road network is turned into a sparse graph weighted by the free flow travel time of each edge and the travel times
+from the stations to the emergencies are found with Dijkstra's algorithm.
+"""
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from sumo_interface import get_indexed_network, get_network_file_path, get_emergency_edge_index, \
+    get_edge_ids_from_gps, get_closest_stations, PREPARATION_TIME
+from network_index import get_emergency_edges, get_random_generator
+from compact_network import CompactNetwork
+
+
+class TravelTimeSurrogate:
+    """
+    This class estimates the response times to emergencies from a network graph.
+    It provides get_response_times and get_batch_response_times like a ResponseTimeSampler so it can back the same
+    loss functions.
+    The emergencies are every emergency edge in the network unless num_emergencies is passed, in which case a fixed
+    sample of emergencies is drawn once and shared by every evaluation.
+    """
+
+    def __init__(self,
+                 simulation_directory,
+                 num_emergencies=None,
+                 speed_factor=1.5,
+                 unreachable_time=3600,
+                 rng=None):
+
+        self.simulation_directory = simulation_directory
+        self.network_file_path = get_network_file_path(simulation_directory)
+        self.speed_factor = speed_factor
+        self.unreachable_time = unreachable_time
+        net = get_indexed_network(self.network_file_path)
+
+        # find the travel time along each edge emergency vehicles can use
+        if isinstance(net, CompactNetwork):
+            edges = net.get_allowed_edges("emergency")
+            num_nodes = len(net.node_ids)
+            self.edge_positions = {edge_id: i for i, edge_id in enumerate(net.edge_ids[edges])}
+            self.edge_from_nodes = np.asarray(net.edge_from_nodes[edges])
+            self.edge_to_nodes = np.asarray(net.edge_to_nodes[edges])
+            self.edge_travel_times = net.edge_lengths[edges] / (net.edge_speeds[edges] * speed_factor)
+        else:
+            node_positions = {node.getID(): i for i, node in enumerate(net.getNodes())}
+            edges = get_emergency_edges(net)
+            num_nodes = len(node_positions)
+            self.edge_positions = {edge.getID(): i for i, edge in enumerate(edges)}
+            self.edge_from_nodes = np.array([node_positions[edge.getFromNode().getID()] for edge in edges])
+            self.edge_to_nodes = np.array([node_positions[edge.getToNode().getID()] for edge in edges])
+            self.edge_travel_times = np.array([edge.getLength() / (edge.getSpeed() * speed_factor) for edge in edges])
+        self.graph = self.build_graph(num_nodes)
+
+        # choose the emergencies used to evaluate placements
+        emergency_index = get_emergency_edge_index(self.network_file_path)
+        if num_emergencies is None:
+            positions = np.arange(len(emergency_index))
+        else:
+            positions = emergency_index.sample_indices(num_emergencies, get_random_generator(rng))
+        emergency_edge_ids = emergency_index.edge_ids[positions]
+        self.emergency_edges = np.array([self.edge_positions[edge_id] for edge_id in emergency_edge_ids])
+        self.emergency_coordinates = np.column_stack((emergency_index.latitudes[positions],
+                                                      emergency_index.longitudes[positions]))
+        self.num_simulations = len(self.emergency_edges)
+        self.deterministic = num_emergencies is None  # a sample of emergencies is only drawn when its size is passed
+
+    def build_graph(self, num_nodes):
+        """Returns a sparse matrix of the shortest travel time of the edges directly connecting each pair of nodes."""
+
+        # keep only the fastest of any parallel edges
+        order = np.lexsort((self.edge_travel_times, self.edge_to_nodes, self.edge_from_nodes))
+        from_nodes, to_nodes = self.edge_from_nodes[order], self.edge_to_nodes[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (from_nodes[1:] != from_nodes[:-1]) | (to_nodes[1:] != to_nodes[:-1])
+
+        return csr_matrix((self.edge_travel_times[order][first], (from_nodes[first], to_nodes[first])),
+                          shape=(num_nodes, num_nodes))
+
+    def get_travel_times(self, station_edge_ids, emergency_edges):
+        """
+        Returns an array of the travel times (in seconds) from each station edge to each emergency edge.
+        The vehicle drives the full length of its station edge, the shortest path between the edges, and the full length
+        of the emergency edge.
+        """
+
+        station_edges = np.array([self.edge_positions[edge_id] for edge_id in station_edge_ids])
+        node_travel_times = dijkstra(self.graph, indices=self.edge_to_nodes[station_edges])
+        travel_times = (self.edge_travel_times[station_edges][:, np.newaxis]
+                        + node_travel_times[:, self.edge_from_nodes[emergency_edges]]
+                        + self.edge_travel_times[emergency_edges][np.newaxis, :])
+
+        # a vehicle already on the emergency edge only has to drive along it
+        same_edge = station_edges[:, np.newaxis] == emergency_edges[np.newaxis, :]
+        edge_travel_times = np.broadcast_to(self.edge_travel_times[emergency_edges], travel_times.shape)
+        travel_times[same_edge] = edge_travel_times[same_edge]
+
+        return np.where(np.isfinite(travel_times), travel_times, self.unreachable_time)
+
+    def get_response_times(self, placements):
+        """Returns an array of the estimated response times to each emergency from the nearest station."""
+
+        station_edge_ids = get_edge_ids_from_gps(self.network_file_path, placements)
+        station_indices, _ = get_closest_stations(self.emergency_coordinates, placements)
+        travel_times = self.get_travel_times(station_edge_ids, self.emergency_edges)
+
+        return PREPARATION_TIME + travel_times[station_indices, np.arange(len(self.emergency_edges))]
+
+    def get_batch_response_times(self, placement_sets):
+        """Returns the estimated response times of each set of placements."""
+
+        return [self.get_response_times(placements) for placements in placement_sets]
+
+    def get_site_response_time_matrix(self, site_coordinates, chunk_size=100):
+        """
+        Takes a list of (lat, lon) coordinates of candidate station sites.
+        Returns an array of the estimated response time from each site to each emergency.
+        The shortest paths are found from chunk_size sites at a time, since the travel times from each site to every
+        node are held in memory until its row of the matrix is filled.
+        """
+
+        site_edge_ids = get_edge_ids_from_gps(self.network_file_path, site_coordinates)
+        response_times = np.empty((len(site_edge_ids), len(self.emergency_edges)))
+        for start in range(0, len(site_edge_ids), chunk_size):
+            response_times[start:start + chunk_size] = PREPARATION_TIME + self.get_travel_times(
+                site_edge_ids[start:start + chunk_size], self.emergency_edges)
+
+        return response_times
+
+    def get_candidate_sites(self, max_sites=None, rng=None):
+        """
+        Returns a list of the (lat, lon) coordinates of the network nodes at the end of the emergency edges.
+        If there are more than max_sites nodes, they are clustered into max_sites clusters and the node nearest the
+        center of each cluster is returned.
+        """
+
+        emergency_index = get_emergency_edge_index(self.network_file_path)
+        coordinates = np.unique(np.column_stack((emergency_index.latitudes, emergency_index.longitudes)), axis=0)
+
+        if max_sites is not None and len(coordinates) > max_sites:
+            centers, _ = kmeans2(coordinates, max_sites, minit='++', seed=get_random_generator(rng))
+            _, indices = cKDTree(coordinates).query(centers)
+            coordinates = coordinates[np.unique(indices)]
+
+        return [tuple(coordinate) for coordinate in coordinates]